@@ -0,0 +1,87 @@
+from maths.ntree import NTree
+from maths.arrayntree import ArrayNTree
+import numpy as np
+import time
+
+
+class RecountingNTree(NTree):
+    @property
+    def point_count(self):
+        """
+        () -> Int
+        Return the number of points in the n-tree by recounting every point
+        stored in its children, as n-trees did before counts were cached.
+        """
+        return len(self.all_points)
+
+
+def make_tree(tree_class, points, capacity):
+    """
+    Class -> np.array -> Int -> NTree
+    Create an n-tree of the given class spanning the unit hypercube.
+    """
+    return tree_class([(0.0, 1.0)] * points.shape[1], capacity)
+
+
+def time_insertion(tree_class, points, capacity, batch_size):
+    """
+    Class -> np.array -> Int -> Int -> (NTree, Float)
+    Insert the points into a new n-tree in batches of the given size,
+    returning the populated tree and the time taken in seconds.
+    """
+    tree = make_tree(tree_class, points, capacity)
+    start = time.time()
+    for i in range(0, points.shape[0], batch_size):
+        tree.add_points(list(points[i : i + batch_size]))
+    return tree, time.time() - start
+
+
+def time_queries(tree, queries):
+    """
+    NTree -> np.array -> Float
+    Return the time taken in seconds to query the relative density and
+    probability density of the tree at each of the query points.
+    """
+    start = time.time()
+    for query in queries:
+        tree.relative_density_at_point(query, error_if_out_of_bounds=False)
+        tree.probability_density(query)
+    return time.time() - start
+
+
+def run(population=8192, dimensions=2, capacity=16, batch_size=256, query_count=256):
+    """
+    Int? -> Int? -> Int? -> Int? -> Int? -> ()
+    Compare the insertion and query throughput of n-trees which cache their
+    point counts against ones that recount their points on every query.
+    """
+    points = np.random.beta(2.0, 5.0, size=(population, dimensions))
+    queries = np.random.uniform(size=(query_count, dimensions))
+
+    for name, tree_class in [("recounting", RecountingNTree), ("cached", NTree)]:
+        tree, insertion_time = time_insertion(tree_class, points, capacity, batch_size)
+        query_time = time_queries(tree, queries)
+        print(
+            "{}: {:.0f} inserts/s, {:.0f} queries/s".format(
+                name, population / insertion_time, query_count / query_time
+            )
+        )
+
+
+def run_array_build(population=10**6, dimensions=70, capacity=64):
+    """
+    Int? -> Int? -> Int? -> ()
+    Time the construction of an array-backed n-tree from a single large batch
+    of points, comparable in size and dimension to a population of Bridge
+    solutions.
+    """
+    points = np.random.beta(2.0, 5.0, size=(population, dimensions))
+
+    start = time.time()
+    tree = ArrayNTree([(0.0, 1.0)] * dimensions, capacity)
+    tree.add_points(points)
+    print(
+        "built {} nodes from {} points in {:.2f}s".format(
+            tree.node_count, population, time.time() - start
+        )
+    )
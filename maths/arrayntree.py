@@ -0,0 +1,537 @@
+from maths.frozenntree import FrozenNTree, route_to_leaves
+import numpy as np
+
+
+class ArrayNTree:
+    def __init__(
+        self, ranges, capacity, points=[], minimum_width=0.001, dtype=np.float64
+    ):
+        """
+        [(Float, Float)] -> Int -> [[Float]]? -> Float? -> np.dtype? -> ArrayNTree
+        Create an n-tree which stores its points in a single contiguous array
+        and its nodes in flat arrays, so that batches of points can be sorted
+        into buckets with vectorised comparisons.  Buckets are split in the
+        same way as those of an NTree.
+        """
+        self.ranges = [(float(l), float(u)) for l, u in ranges]
+        self.dimensions = len(self.ranges)
+
+        self.capacity = capacity
+        self.minimum_width = minimum_width
+        self.dtype = dtype
+
+        self._node_count = 1
+        self._lower = np.array([[l for l, _ in self.ranges]], dtype=np.float64)
+        self._upper = np.array([[u for _, u in self.ranges]], dtype=np.float64)
+        self._split_dimension = np.zeros(1, dtype=np.int64)
+        self._split_value = np.zeros(1, dtype=np.float64)
+        self._first_child = np.full(1, -1, dtype=np.int64)
+        self._parent = np.full(1, -1, dtype=np.int64)
+        self._depth = np.zeros(1, dtype=np.int64)
+        self._count = np.zeros(1, dtype=np.int64)
+
+        self._point_count = 0
+        self._points = np.empty((0, self.dimensions), dtype=self.dtype)
+        self._point_nodes = np.empty(0, dtype=np.int64)
+        self._point_labels = np.empty(0, dtype=np.int64)
+        self._frozen, self._frozen_with_points = None, None
+
+        self.add_points(points)
+
+    def add_point(self, new_point, check_within_bounds=False):
+        """
+        [Float] -> Bool? -> ()
+        Add a new point to the n-tree, sorting it into the relevant bucket.
+        """
+        self.add_points([new_point], check_within_bounds=check_within_bounds)
+
+    def add_points(self, new_points, check_within_bounds=False, label=0):
+        """
+        [[Float]] -> Bool? -> Int? -> ()
+        Sort a batch of points into the n-tree.  The whole batch is routed down
+        the tree one level at a time, and any buckets which then exceed their
+        capacity are split, again one level at a time across all buckets.  Each
+        point is tagged with an integer label, so that several sample sets can
+        share one tree and be counted separately.
+        """
+        points = np.asarray(new_points, dtype=self.dtype).reshape(-1, self.dimensions)
+        if check_within_bounds:
+            points = points[self.within_bounds(points)]
+        if points.shape[0] == 0:
+            return
+        self._frozen, self._frozen_with_points = None, None
+
+        leaves = route_to_leaves(
+            points, self._first_child, self._split_dimension, self._split_value
+        )
+        self._add_to_counts(leaves)
+
+        start, end = self._point_count, self._point_count + points.shape[0]
+        self._reserve_points(end)
+        self._points[start:end] = points
+        self._point_nodes[start:end] = leaves
+        self._point_labels[start:end] = label
+        self._point_count = end
+
+        self._split_overcrowded(np.unique(leaves))
+
+    def _add_to_counts(self, leaves):
+        """
+        np.array -> ()
+        Increment the counts of the given leaves and all of their ancestors.
+        """
+        nodes = leaves
+        while nodes.size > 0:
+            self._count[: self._node_count] += np.bincount(
+                nodes, minlength=self._node_count
+            )
+            nodes = self._parent[nodes]
+            nodes = nodes[nodes >= 0]
+
+    def _split_overcrowded(self, leaves):
+        """
+        np.array -> ()
+        Split every given leaf which holds more points than the capacity, and
+        keep splitting the resulting children until no leaf is overcrowded.
+        """
+        while leaves.size > 0:
+            dimensions = self._split_dimension[leaves]
+            lower = self._lower[leaves, dimensions]
+            upper = self._upper[leaves, dimensions]
+            overcrowded = (self._count[leaves] > self.capacity) & (
+                upper > lower + self.minimum_width
+            )
+            leaves = leaves[overcrowded]
+            if leaves.size == 0:
+                return
+            leaves = self._create_children(
+                leaves, dimensions[overcrowded], lower[overcrowded], upper[overcrowded]
+            )
+
+    def _create_children(self, parents, dimensions, lower, upper):
+        """
+        np.array -> np.array -> np.array -> np.array -> np.array
+        Split each parent in half along its designated axis, redistributing
+        its points between the two new children.  Returns the indices of the
+        newly created children.
+        """
+        n = parents.size
+        first = self._node_count + 2 * np.arange(n)
+        children = np.stack([first, first + 1], axis=1).reshape(-1)
+        self._reserve_nodes(self._node_count + 2 * n)
+        self._node_count += 2 * n
+
+        split_values = 0.5 * (lower + upper)
+        self._split_value[parents] = split_values
+        self._first_child[parents] = first
+
+        self._lower[children] = np.repeat(self._lower[parents], 2, axis=0)
+        self._upper[children] = np.repeat(self._upper[parents], 2, axis=0)
+        self._upper[first, dimensions] = split_values
+        self._lower[first + 1, dimensions] = split_values
+        self._split_dimension[children] = np.repeat(
+            (dimensions + 1) % self.dimensions, 2
+        )
+        self._first_child[children] = -1
+        self._parent[children] = np.repeat(parents, 2)
+        self._depth[children] = np.repeat(self._depth[parents] + 1, 2)
+
+        splitting = np.zeros(self._node_count, dtype=bool)
+        splitting[parents] = True
+        moving = np.flatnonzero(splitting[self._point_nodes[: self._point_count]])
+        owners = self._point_nodes[moving]
+        destinations = self._first_child[owners] + (
+            self._points[moving, self._split_dimension[owners]]
+            >= self._split_value[owners]
+        )
+        self._point_nodes[moving] = destinations
+        self._count[children] = np.bincount(destinations, minlength=self._node_count)[
+            children
+        ]
+
+        return children
+
+    def _reserve_nodes(self, size):
+        """
+        Int -> ()
+        Ensure that the node arrays have room for at least the given number
+        of nodes, growing them geometrically if not.
+        """
+        if size <= self._first_child.size:
+            return
+        new_size = max(size, 2 * self._first_child.size)
+        self._lower = _resized(self._lower, new_size)
+        self._upper = _resized(self._upper, new_size)
+        self._split_dimension = _resized(self._split_dimension, new_size)
+        self._split_value = _resized(self._split_value, new_size)
+        self._first_child = _resized(self._first_child, new_size)
+        self._parent = _resized(self._parent, new_size)
+        self._depth = _resized(self._depth, new_size)
+        self._count = _resized(self._count, new_size)
+
+    def _reserve_points(self, size):
+        """
+        Int -> ()
+        Ensure that the point arrays have room for at least the given number
+        of points, growing them geometrically if not.
+        """
+        if size <= self._point_nodes.size:
+            return
+        new_size = max(size, 2 * self._point_nodes.size)
+        self._points = _resized(self._points, new_size)
+        self._point_nodes = _resized(self._point_nodes, new_size)
+        self._point_labels = _resized(self._point_labels, new_size)
+
+    def within_bounds(self, points):
+        """
+        np.array -> np.array
+        Determine, for each of a batch of points, whether it is contained within
+        the bounds of the n-tree.
+        """
+        points = np.asarray(points).reshape(-1, self.dimensions)
+        return np.all((self._lower[0] <= points) & (points < self._upper[0]), axis=1)
+
+    def smallest_bucket_containing(self, point, error_if_out_of_bounds=True):
+        """
+        [Float] -> Bool? -> ArrayNTree.Bucket
+        Find the smallest enclosing bucket that contains the given point.  If
+        the point is not within the bounds of the tree at all, returns None.
+        """
+        point = np.asarray(point, dtype=np.float64).reshape(1, self.dimensions)
+        if not self.within_bounds(point)[0]:
+            if error_if_out_of_bounds:
+                raise Exception(
+                    "point {} not within bounds {} of bucket".format(
+                        str(list(point[0])), str(self.ranges)
+                    )
+                )
+            else:
+                return None
+
+        leaf = route_to_leaves(
+            point, self._first_child, self._split_dimension, self._split_value
+        )[0]
+        return ArrayNTree.Bucket(self, leaf)
+
+    def relative_density_at_point(self, point, error_if_out_of_bounds=True):
+        """
+        [Float] -> Bool? -> Float
+        Calculate the relative density of a point within the tree.
+        """
+        bucket = self.smallest_bucket_containing(
+            point, error_if_out_of_bounds=error_if_out_of_bounds
+        )
+        return bucket.relative_density if bucket is not None else 0.0
+
+    def probability_density(self, point):
+        """
+        [Float] -> Float
+        Calculate the probability density of the tree, interpreted as a probability
+        distribution, at the given location.
+        """
+        bucket = self.smallest_bucket_containing(point, error_if_out_of_bounds=False)
+        return (
+            bucket.point_count / (self.point_count * bucket.volume)
+            if bucket is not None
+            else 0.0
+        )
+
+    def relative_density_at_points(self, points):
+        """
+        np.array -> np.array
+        Calculate the relative density within the tree of each of a batch of
+        points.  Points outside the bounds of the tree are given a relative
+        density of zero.
+        """
+        leaves, within_bounds = self._leaves_containing(points)
+        relative_densities = (
+            self._count[: self._node_count] / self.point_count
+        ) * 2.0 ** self._depth[: self._node_count]
+        return np.where(within_bounds, relative_densities[leaves], 0.0)
+
+    def probability_density_many(self, points):
+        """
+        np.array -> np.array
+        Calculate the probability density of the tree, interpreted as a probability
+        distribution, at each of a batch of points.
+        """
+        return self.relative_density_at_points(points) / self.volume
+
+    def _leaves_containing(self, points):
+        """
+        np.array -> (np.array, np.array)
+        Route a batch of points down the tree together, returning the leaf
+        into which each falls and whether it is within the bounds of the tree.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, self.dimensions)
+        leaves = route_to_leaves(
+            points, self._first_child, self._split_dimension, self._split_value
+        )
+        return leaves, self.within_bounds(points)
+
+    def range_count(self, lower, upper):
+        """
+        np.array -> np.array -> np.array
+        Count the points within each of a batch of boxes, given by their lower
+        and upper corners.
+        """
+        return self._queryable_points().range_count(lower, upper)
+
+    def nearest_neighbours(self, points, k=1):
+        """
+        np.array -> Int? -> (np.array, np.array)
+        Return the distances to, and positions of, the k stored points nearest
+        to each query point.
+        """
+        frozen = self._queryable_points()
+        distances, indices = frozen.nearest_neighbours(points, k=k)
+        return distances, frozen.points[indices]
+
+    def sample(self, n, generator=None):
+        """
+        Int -> np.random.Generator? -> np.array
+        Draw n points from the density of the n-tree.
+        """
+        return self.frozen.sample(n, generator=generator)
+
+    @property
+    def frozen(self):
+        """
+        () -> FrozenNTree
+        Return the frozen copy of the tree's nodes which answers sampling
+        queries.  It is compiled on first use and discarded whenever points are
+        added.
+        """
+        if self._frozen is None:
+            self._frozen = self.freeze()
+        return self._frozen
+
+    def _queryable_points(self):
+        """
+        () -> FrozenNTree
+        As `frozen`, but with the tree's points copied in as well, for range and
+        neighbour queries.
+        """
+        if self._frozen_with_points is None:
+            self._frozen_with_points = self.freeze(store_points=True)
+        return self._frozen_with_points
+
+    def freeze(self, store_points=False):
+        """
+        Bool? -> FrozenNTree
+        Compile the n-tree into an immutable lookup structure whose leaf densities
+        are precomputed.  Later changes to this tree are not reflected in it.
+        Optionally, the points in the tree are copied into the frozen tree too.
+        """
+        n = self._node_count
+        return FrozenNTree(
+            self._lower[:n],
+            self._upper[:n],
+            self._split_dimension[:n],
+            self._split_value[:n],
+            self._first_child[:n],
+            self._count[:n],
+            points=self.all_points if store_points else None,
+            point_leaves=(
+                self._point_nodes[: self._point_count] if store_points else None
+            ),
+        )
+
+    @property
+    def leaves(self):
+        """
+        () -> np.array
+        Return the indices of all nodes which have no children.
+        """
+        return np.flatnonzero(self._first_child[: self._node_count] < 0)
+
+    def label_counts(self, label):
+        """
+        Int -> np.array
+        Return the number of points with the given label in each leaf, in the
+        same order as the leaf indices returned by `leaves`.
+        """
+        n = self._point_count
+        nodes = self._point_nodes[:n][self._point_labels[:n] == label]
+        return np.bincount(nodes, minlength=self._node_count)[self.leaves]
+
+    @property
+    def child_buckets(self):
+        """
+        () -> [ArrayNTree.Bucket]
+        Return a list of all buckets of the n-tree which themselves have no children.
+        """
+        return [ArrayNTree.Bucket(self, leaf) for leaf in self.leaves]
+
+    @property
+    def all_points(self):
+        """
+        () -> np.array
+        Return an array of all points contained within the n-tree.
+        """
+        return self._points[: self._point_count]
+
+    @property
+    def point_count(self):
+        """
+        () -> Int
+        Return the number of points in the n-tree.
+        """
+        return self._point_count
+
+    @property
+    def node_count(self):
+        """
+        () -> Int
+        Return the number of nodes, both branches and leaves, in the n-tree.
+        """
+        return self._node_count
+
+    @property
+    def volume(self):
+        """
+        () -> Float
+        Calculate the volume of the region bounded by the tree.
+        """
+        return float(np.prod(self._upper[0] - self._lower[0]))
+
+    def __str__(self):
+        """
+        () -> String
+        Return a string representation of the n-tree based on the number
+        of points it contains.
+        """
+        return str(ArrayNTree.Bucket(self, 0))
+
+    class Bucket:
+        def __init__(self, tree, index):
+            """
+            ArrayNTree -> Int -> ArrayNTree.Bucket
+            Create a view onto a single node of an array-backed n-tree, exposing
+            the same properties as a bucket of an NTree.
+            """
+            self.tree = tree
+            self.index = index
+
+        @property
+        def ranges(self):
+            """
+            () -> [(Float, Float)]
+            Return the bounds of the bucket in each dimension.
+            """
+            return [
+                (float(l), float(u))
+                for l, u in zip(
+                    self.tree._lower[self.index], self.tree._upper[self.index]
+                )
+            ]
+
+        @property
+        def has_children(self):
+            """
+            () -> Bool
+            Determine whether the bucket has been split into children.
+            """
+            return self.tree._first_child[self.index] >= 0
+
+        @property
+        def split_dimension(self):
+            """
+            () -> Int
+            Return the dimension along which the bucket is, or would be, split.
+            """
+            return int(self.tree._split_dimension[self.index])
+
+        @property
+        def points(self):
+            """
+            () -> np.array
+            Return an array of all points contained within the bucket.
+            """
+            nodes = self.tree._point_nodes[: self.tree._point_count]
+            within = np.zeros(self.tree._node_count, dtype=bool)
+            within[self._descendants] = True
+            return self.tree.all_points[within[nodes]]
+
+        @property
+        def _descendants(self):
+            """
+            () -> [Int]
+            Return the indices of the bucket and all nodes beneath it.
+            """
+            descendants, frontier = [self.index], [self.index]
+            while len(frontier) > 0:
+                node = frontier.pop()
+                first = self.tree._first_child[node]
+                if first >= 0:
+                    descendants += [first, first + 1]
+                    frontier += [first, first + 1]
+            return descendants
+
+        @property
+        def point_count(self):
+            """
+            () -> Int
+            Return the number of points in the bucket.
+            """
+            return int(self.tree._count[self.index])
+
+        @property
+        def volume(self):
+            """
+            () -> Float
+            Calculate the volume of the region bounded by the bucket.
+            """
+            return float(
+                np.prod(self.tree._upper[self.index] - self.tree._lower[self.index])
+            )
+
+        @property
+        def density(self):
+            """
+            () -> Float
+            Calculate the density of the region bounded by the bucket.
+            """
+            return self.point_count / self.volume
+
+        @property
+        def depth(self):
+            """
+            () -> Int
+            Return the depth of the bucket in its enclosing n-tree.
+            """
+            return int(self.tree._depth[self.index])
+
+        @property
+        def relative_density(self):
+            """
+            () -> Float
+            Return the ratio of proportion of total points to proportion of total
+            volume.  Can be interpreted as the density of the n-tree within this
+            bucket relative to one which is filled uniformly.
+            """
+            return (self.point_count / self.tree.point_count) / (2 ** (-self.depth))
+
+        def __str__(self):
+            """
+            () -> String
+            Return a string representation of the bucket based on the number
+            of points it contains.
+            """
+            if not self.has_children:
+                return str(self.point_count)
+            first = self.tree._first_child[self.index]
+            return "({}, {})".format(
+                str(ArrayNTree.Bucket(self.tree, first)),
+                str(ArrayNTree.Bucket(self.tree, first + 1)),
+            )
+
+
+def _resized(array, size):
+    """
+    np.array -> Int -> np.array
+    Return a copy of an array with its first axis extended to the given size.
+    """
+    resized = np.empty((size,) + array.shape[1:], dtype=array.dtype)
+    resized[: array.shape[0]] = array
+    return resized
@@ -0,0 +1,105 @@
+import numpy as np
+
+
+def autocorrelation(samples, max_lag=None):
+    """
+    np.array -> Int? -> np.array
+    Estimate the autocorrelation of a batch of chains, given as an array of
+    shape (draws, chains, dimensions), at each lag up to the maximum.  The
+    autocovariances of every chain are averaged before being normalised, giving
+    an array of shape (max_lag + 1, dimensions).
+    """
+    autocovariances = _mean_autocovariance(samples)
+    if max_lag is not None:
+        autocovariances = autocovariances[: max_lag + 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return autocovariances / autocovariances[0]
+
+
+def split_r_hat(samples):
+    """
+    np.array -> np.array
+    Calculate the split potential scale reduction factor of each dimension of
+    a batch of chains, given as an array of shape (draws, chains, dimensions).
+    Each chain is split in half, so that chains which have not yet reached
+    their stationary distribution are detected as well as chains which disagree
+    with one another.  Values close to 1 suggest the chains have mixed.
+    """
+    within, pooled = _variances(_split_chains(samples))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.sqrt(pooled / within)
+
+
+def effective_sample_size(samples):
+    """
+    np.array -> np.array
+    Estimate the effective sample size of each dimension of a batch of chains,
+    given as an array of shape (draws, chains, dimensions).  Autocorrelations
+    are combined across chains and summed in pairs of lags until a pair becomes
+    negative, with the pairs forced to decrease monotonically, following Geyer's
+    initial monotone sequence estimator.  Dimensions along which the chains
+    never move carry no information about the target, and are given an
+    effective sample size of zero.
+    """
+    draws, chains, _ = samples.shape
+    within, pooled = _variances(samples)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        correlations = 1.0 - (within - _mean_autocovariance(samples)) / pooled
+    correlations[0] = 1.0
+
+    pairs = correlations[: 2 * (draws // 2)].reshape(draws // 2, 2, -1).sum(axis=1)
+    initial_positive = np.cumprod(pairs > 0, axis=0).astype(bool)
+    monotone = np.minimum.accumulate(np.where(initial_positive, pairs, 0.0), axis=0)
+    integrated_time = np.maximum(-1.0 + 2.0 * np.sum(monotone, axis=0), 1.0 / draws)
+    return np.where(pooled > 0, draws * chains / integrated_time, 0.0)
+
+
+def convergence_diagnostics(samples):
+    """
+    np.array -> Dict
+    Summarise the convergence of a batch of chains, given as an array of shape
+    (draws, chains, dimensions), as a JSON-like object.  The worst value over
+    all dimensions is reported for each measure.
+    """
+    return {
+        "draws": int(samples.shape[0]),
+        "chains": int(samples.shape[1]),
+        "effectiveSampleSize": float(np.min(effective_sample_size(samples))),
+        "splitRHat": float(np.max(split_r_hat(samples))),
+    }
+
+
+def _mean_autocovariance(samples):
+    """
+    np.array -> np.array
+    Calculate the autocovariance of each chain at every lag using a fast
+    Fourier transform, and average over the chains.
+    """
+    draws = samples.shape[0]
+    deviations = samples - np.mean(samples, axis=0)
+    size = 2 ** int(np.ceil(np.log2(2 * draws)))
+    transform = np.fft.rfft(deviations, n=size, axis=0)
+    autocovariances = np.fft.irfft(transform * np.conj(transform), n=size, axis=0)
+    return np.mean(autocovariances[:draws], axis=1) / draws
+
+
+def _variances(samples):
+    """
+    np.array -> (np.array, np.array)
+    Return the mean variance within each chain, and the pooled estimate of the
+    variance of the target which also accounts for variance between chains.
+    """
+    draws, chains, _ = samples.shape
+    within = np.mean(np.var(samples, axis=0, ddof=1), axis=0)
+    between = np.var(np.mean(samples, axis=0), axis=0, ddof=1) if chains > 1 else 0.0
+    return within, (draws - 1) / draws * within + between
+
+
+def _split_chains(samples):
+    """
+    np.array -> np.array
+    Split each chain into its first and second halves, treating each half as
+    a separate chain.  The middle draw of chains of odd length is discarded.
+    """
+    half = samples.shape[0] // 2
+    return np.concatenate([samples[:half], samples[-half:]], axis=1)
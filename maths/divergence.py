@@ -0,0 +1,52 @@
+from maths.arrayntree import ArrayNTree
+import numpy as np
+
+
+def two_sample_divergences(
+    ranges, capacity, true_points, generated_points, minimum_width=0.001, smoothing=0.5
+):
+    """
+    [(Float, Float)] -> Int -> [[Float]] -> [[Float]] -> Float? -> Float? -> Dict
+    Insert two labelled sets of samples into a single n-tree, and compare the
+    piecewise-constant distributions they induce over its leaves.
+    """
+    tree = ArrayNTree(ranges, capacity, minimum_width=minimum_width)
+    tree.add_points(true_points, check_within_bounds=True, label=0)
+    tree.add_points(generated_points, check_within_bounds=True, label=1)
+    return leaf_divergences(
+        tree.label_counts(0), tree.label_counts(1), smoothing=smoothing
+    )
+
+
+def leaf_divergences(true_counts, generated_counts, smoothing=0.5):
+    """
+    np.array -> np.array -> Float? -> Dict
+    Calculate divergences between the distributions of true and generated
+    samples from the number of each falling into each leaf of a shared tree.
+    Both distributions share the same leaves, so leaf volumes cancel and only
+    the counts are needed.
+
+    The KL divergence is that of the generated distribution from the true
+    one, with the given pseudo-count added to every leaf of the generated
+    distribution so that it remains finite.  Recall is the proportion of true
+    samples in leaves which also contain a generated sample, and precision the
+    proportion of generated samples in leaves which also contain a true one.
+    """
+    true_counts = np.asarray(true_counts, dtype=np.float64)
+    generated_counts = np.asarray(generated_counts, dtype=np.float64)
+
+    p = true_counts / true_counts.sum()
+    q = generated_counts / generated_counts.sum()
+    q_smoothed = (generated_counts + smoothing) / (
+        generated_counts.sum() + smoothing * generated_counts.size
+    )
+
+    occupied = p > 0
+    return {
+        "klDivergence": float(
+            np.sum(p[occupied] * np.log(p[occupied] / q_smoothed[occupied]))
+        ),
+        "totalVariation": float(0.5 * np.sum(np.abs(p - q))),
+        "recall": float(np.sum(p[generated_counts > 0])),
+        "precision": float(np.sum(q[true_counts > 0])),
+    }
@@ -0,0 +1,497 @@
+from json import dumps, loads
+import numpy as np
+
+_magic = b"NTREE\x00\x01\x00"
+
+
+class FrozenNTree:
+
+    node_arrays = [
+        "lower",
+        "upper",
+        "split_dimension",
+        "split_value",
+        "first_child",
+        "count",
+        "relative_densities",
+        "probability_densities",
+    ]
+    point_arrays = ["points", "point_start", "point_end"]
+
+    def __init__(
+        self,
+        lower,
+        upper,
+        split_dimension,
+        split_value,
+        first_child,
+        count,
+        points=None,
+        point_leaves=None,
+    ):
+        """
+        np.array -> np.array -> np.array -> np.array -> np.array -> np.array
+            -> np.array? -> np.array? -> FrozenNTree
+        Create an immutable n-tree from flat node arrays, in which the children
+        of node i are nodes first_child[i] and first_child[i] + 1, and leaves
+        have a first child of -1.  Node 0 is the root.  The relative and
+        probability densities of every node are computed once on creation.
+
+        Optionally, the points stored in the tree may be kept as well, along
+        with the index of the leaf containing each.  They are reordered so that
+        the points beneath node i are points[point_start[i]:point_end[i]].
+        """
+        count = np.asarray(count, dtype=np.int64)
+        lower = np.asarray(lower, dtype=np.float64)
+        upper = np.asarray(upper, dtype=np.float64)
+        volumes = np.prod(upper - lower, axis=1)
+        relative_densities = (count / count[0]) / (volumes / volumes[0])
+
+        arrays = {
+            "lower": lower,
+            "upper": upper,
+            "split_dimension": np.asarray(split_dimension, dtype=np.int64),
+            "split_value": np.asarray(split_value, dtype=np.float64),
+            "first_child": np.asarray(first_child, dtype=np.int64),
+            "count": count,
+            "relative_densities": relative_densities,
+            "probability_densities": relative_densities / volumes[0],
+        }
+        if points is not None:
+            arrays.update(
+                _arrange_points(
+                    arrays["first_child"],
+                    np.asarray(points, dtype=np.float64).reshape(-1, lower.shape[1]),
+                    np.asarray(point_leaves, dtype=np.int64),
+                )
+            )
+
+        self._set_arrays({k: _read_only(v) for k, v in arrays.items()})
+
+    def _set_arrays(self, arrays):
+        """
+        Dict -> ()
+        Store the node arrays, and any point arrays, of the tree and derive
+        its scalar properties from them.
+        """
+        for name in FrozenNTree.node_arrays + FrozenNTree.point_arrays:
+            setattr(self, name, arrays[name] if name in arrays else None)
+
+        self.dimensions = self.lower.shape[1]
+        self.ranges = [
+            (float(l), float(u)) for l, u in zip(self.lower[0], self.upper[0])
+        ]
+        self.point_count = int(self.count[0])
+        self.volume = float(np.prod(self.upper[0] - self.lower[0]))
+
+    @property
+    def has_points(self):
+        """
+        () -> Bool
+        Determine whether the points of the tree are stored alongside its nodes.
+        """
+        return self.points is not None
+
+    def save(self, path):
+        """
+        String -> ()
+        Write the tree to a binary file.  The file starts with a JSON header
+        giving the type, shape, and offset of each array, after which the raw
+        contents of the arrays follow.
+        """
+        arrays = {
+            name: np.ascontiguousarray(getattr(self, name))
+            for name in FrozenNTree.node_arrays + FrozenNTree.point_arrays
+            if getattr(self, name) is not None
+        }
+
+        header, offset = {}, 0
+        for name, array in arrays.items():
+            header[name] = {
+                "dtype": array.dtype.str,
+                "shape": list(array.shape),
+                "offset": offset,
+            }
+            offset += _aligned(array.nbytes)
+
+        encoded_header = dumps(header).encode("utf-8")
+        data_start = _aligned(len(_magic) + 8 + len(encoded_header))
+
+        with open(path, "wb") as f:
+            f.write(_magic)
+            f.write(np.uint64(len(encoded_header)).tobytes())
+            f.write(encoded_header)
+            for name, array in arrays.items():
+                f.seek(data_start + header[name]["offset"])
+                f.write(array.tobytes())
+            f.truncate(data_start + offset)
+
+    @staticmethod
+    def load(path):
+        """
+        String -> FrozenNTree
+        Open a tree written by `save`.  Its arrays are memory-mapped rather than
+        read, so the tree is available immediately regardless of its size.
+        """
+        with open(path, "rb") as f:
+            if f.read(len(_magic)) != _magic:
+                raise ValueError("{} is not a saved n-tree".format(path))
+            header_length = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+            header = loads(f.read(header_length).decode("utf-8"))
+        data_start = _aligned(len(_magic) + 8 + header_length)
+
+        tree = FrozenNTree.__new__(FrozenNTree)
+        tree._set_arrays(
+            {
+                name: _map_array(path, data_start, description)
+                for name, description in header.items()
+            }
+        )
+        return tree
+
+    @property
+    def node_count(self):
+        """
+        () -> Int
+        Return the number of nodes, both branches and leaves, in the n-tree.
+        """
+        return self.first_child.shape[0]
+
+    @property
+    def leaves(self):
+        """
+        () -> np.array
+        Return the indices of all nodes which have no children.
+        """
+        return np.flatnonzero(self.first_child < 0)
+
+    def within_bounds(self, point):
+        """
+        [Float] -> Bool
+        Determine whether a point is contained within the bounds of the n-tree.
+        """
+        return all([l <= x < u for x, (l, u) in zip(point, self.ranges)])
+
+    def leaf_containing(self, point, error_if_out_of_bounds=True):
+        """
+        [Float] -> Bool? -> Int
+        Find the index of the leaf that contains the given point.  If the point
+        is not within the bounds of the tree at all, returns None.
+        """
+        if not self.within_bounds(point):
+            if error_if_out_of_bounds:
+                raise Exception(
+                    "point {} not within bounds {} of bucket".format(
+                        str(point), str(self.ranges)
+                    )
+                )
+            else:
+                return None
+
+        node = 0
+        while self.first_child[node] >= 0:
+            node = self.first_child[node] + (
+                point[self.split_dimension[node]] >= self.split_value[node]
+            )
+        return node
+
+    def leaves_containing(self, points):
+        """
+        np.array -> (np.array, np.array)
+        Find the index of the leaf containing each of a batch of points, along
+        with whether each point is within the bounds of the tree at all.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, self.dimensions)
+        within_bounds = np.all(
+            (self.lower[0] <= points) & (points < self.upper[0]), axis=1
+        )
+        leaves = route_to_leaves(
+            points, self.first_child, self.split_dimension, self.split_value
+        )
+        return leaves, within_bounds
+
+    def relative_density_at_point(self, point, error_if_out_of_bounds=True):
+        """
+        [Float] -> Bool? -> Float
+        Calculate the relative density of a point within the tree.
+        """
+        leaf = self.leaf_containing(
+            point, error_if_out_of_bounds=error_if_out_of_bounds
+        )
+        return float(self.relative_densities[leaf]) if leaf is not None else 0.0
+
+    def relative_density_at_points(self, points):
+        """
+        np.array -> np.array
+        Calculate the relative density within the tree of each of a batch of
+        points.  Points outside the bounds of the tree are given a relative
+        density of zero.
+        """
+        leaves, within_bounds = self.leaves_containing(points)
+        return np.where(within_bounds, self.relative_densities[leaves], 0.0)
+
+    def probability_density(self, point):
+        """
+        [Float] -> Float
+        Calculate the probability density of the tree, interpreted as a probability
+        distribution, at the given location.
+        """
+        leaf = self.leaf_containing(point, error_if_out_of_bounds=False)
+        return float(self.probability_densities[leaf]) if leaf is not None else 0.0
+
+    def probability_density_many(self, points):
+        """
+        np.array -> np.array
+        Calculate the probability density of the tree, interpreted as a probability
+        distribution, at each of a batch of points.
+        """
+        leaves, within_bounds = self.leaves_containing(points)
+        return np.where(within_bounds, self.probability_densities[leaves], 0.0)
+
+    def sample(self, n, generator=None):
+        """
+        Int -> np.random.Generator? -> np.array
+        Draw n points from the piecewise-constant distribution represented by
+        the tree, by choosing leaves in proportion to the number of points they
+        contain and then sampling uniformly within each chosen leaf.  A numpy
+        random generator may be given; otherwise the global state is used.
+        """
+        if self.point_count == 0:
+            raise ValueError("cannot sample from an empty n-tree")
+        random = np.random if generator is None else generator
+
+        leaves = self.leaves
+        chosen = random.choice(leaves, size=n, p=self.count[leaves] / self.point_count)
+        lower, upper = self.lower[chosen], self.upper[chosen]
+        return lower + random.uniform(size=(n, self.dimensions)) * (upper - lower)
+
+    def range_count(self, lower, upper):
+        """
+        np.array -> np.array -> np.array
+        Count the stored points within each of a batch of boxes, given as arrays
+        of their lower and upper corners, where a point x is within a box if
+        lower <= x < upper.  Nodes lying entirely inside or outside a box are
+        counted or discarded without examining their points.
+        """
+        self._require_points()
+        lower = np.asarray(lower, dtype=np.float64).reshape(-1, self.dimensions)
+        upper = np.asarray(upper, dtype=np.float64).reshape(-1, self.dimensions)
+
+        counts = np.zeros(lower.shape[0], dtype=np.int64)
+        stack = [(0, np.arange(lower.shape[0]))]
+        while len(stack) > 0:
+            node, queries = stack.pop()
+            overlapping = np.all(
+                (lower[queries] < self.upper[node])
+                & (upper[queries] > self.lower[node]),
+                axis=1,
+            )
+            queries = queries[overlapping]
+            contained = np.all(
+                (lower[queries] <= self.lower[node])
+                & (upper[queries] >= self.upper[node]),
+                axis=1,
+            )
+            start, end = self.point_start[node], self.point_end[node]
+            counts[queries[contained]] += end - start
+            queries = queries[~contained]
+
+            if queries.size == 0:
+                continue
+            elif self.first_child[node] < 0:
+                points = self.points[start:end][np.newaxis]
+                inside = np.all(
+                    (lower[queries, np.newaxis] <= points)
+                    & (points < upper[queries, np.newaxis]),
+                    axis=2,
+                )
+                counts[queries] += inside.sum(axis=1)
+            else:
+                first = self.first_child[node]
+                stack += [(first, queries), (first + 1, queries)]
+        return counts
+
+    def nearest_neighbours(self, points, k=1):
+        """
+        np.array -> Int? -> (np.array, np.array)
+        Find the k stored points nearest to each of a batch of points, returning
+        their Euclidean distances and their indices into the tree's points, both
+        sorted by distance.  Each point's own leaf is searched first, and nodes
+        further away than the current kth nearest neighbour are then pruned.
+        """
+        self._require_points()
+        if k > self.points.shape[0]:
+            raise ValueError(
+                "cannot find {} neighbours among {} points".format(
+                    k, self.points.shape[0]
+                )
+            )
+        points = np.asarray(points, dtype=np.float64).reshape(-1, self.dimensions)
+        distances = np.full((points.shape[0], k), np.inf)
+        indices = np.full((points.shape[0], k), -1, dtype=np.int64)
+
+        home_leaves = route_to_leaves(
+            points, self.first_child, self.split_dimension, self.split_value
+        )
+        for leaf in np.unique(home_leaves):
+            queries = np.flatnonzero(home_leaves == leaf)
+            self._update_neighbours(points, queries, leaf, distances, indices)
+
+        stack = [(0, np.arange(points.shape[0]))]
+        while len(stack) > 0:
+            node, queries = stack.pop()
+            gaps = np.maximum(
+                np.maximum(self.lower[node] - points[queries], 0.0),
+                points[queries] - self.upper[node],
+            )
+            queries = queries[np.sum(gaps**2, axis=1) < distances[queries, -1]]
+
+            if queries.size == 0:
+                continue
+            elif self.first_child[node] < 0:
+                queries = queries[home_leaves[queries] != node]
+                self._update_neighbours(points, queries, node, distances, indices)
+            else:
+                first = self.first_child[node]
+                below_split = (
+                    points[queries, self.split_dimension[node]] < self.split_value[node]
+                )
+                if np.mean(below_split) >= 0.5:
+                    stack += [(first + 1, queries), (first, queries)]
+                else:
+                    stack += [(first, queries), (first + 1, queries)]
+
+        return np.sqrt(distances), indices
+
+    def _update_neighbours(self, points, queries, leaf, distances, indices):
+        """
+        np.array -> np.array -> Int -> np.array -> np.array -> ()
+        Merge the points of a leaf into the squared distances and indices of the
+        nearest neighbours found so far for the given queries.
+        """
+        start, end = self.point_start[leaf], self.point_end[leaf]
+        if queries.size == 0 or end == start:
+            return
+
+        k = distances.shape[1]
+        candidate_distances = np.concatenate(
+            [
+                distances[queries],
+                np.sum(
+                    (points[queries, np.newaxis] - self.points[np.newaxis, start:end])
+                    ** 2,
+                    axis=2,
+                ),
+            ],
+            axis=1,
+        )
+        candidate_indices = np.concatenate(
+            [
+                indices[queries],
+                np.broadcast_to(np.arange(start, end), (queries.size, end - start)),
+            ],
+            axis=1,
+        )
+
+        nearest = np.argsort(candidate_distances, axis=1, kind="stable")[:, :k]
+        distances[queries] = np.take_along_axis(candidate_distances, nearest, axis=1)
+        indices[queries] = np.take_along_axis(candidate_indices, nearest, axis=1)
+
+    def _require_points(self):
+        """
+        () -> ()
+        Raise an error if the tree was frozen without storing its points.
+        """
+        if not self.has_points:
+            raise ValueError("n-tree was frozen without storing its points")
+
+
+def route_to_leaves(points, first_child, split_dimension, split_value):
+    """
+    np.array -> np.array -> np.array -> np.array -> np.array
+    Find the index of the leaf into which each of a batch of points falls,
+    moving every point down one level of the tree at a time.
+    """
+    nodes = np.zeros(points.shape[0], dtype=np.int64)
+    active = np.arange(points.shape[0]) if first_child[0] >= 0 else nodes[:0]
+    while active.size > 0:
+        parents = nodes[active]
+        nodes[active] = first_child[parents] + (
+            points[active, split_dimension[parents]] >= split_value[parents]
+        )
+        active = active[first_child[nodes[active]] >= 0]
+    return nodes
+
+
+def _arrange_points(first_child, points, point_leaves):
+    """
+    np.array -> np.array -> np.array -> Dict
+    Sort points by the depth-first order of the leaves containing them, so
+    that the points beneath every node form a contiguous block, and find the
+    start and end of each node's block.
+    """
+    preorder, stack = [], [0]
+    while len(stack) > 0:
+        node = stack.pop()
+        preorder.append(node)
+        if first_child[node] >= 0:
+            stack += [first_child[node] + 1, first_child[node]]
+
+    leaf_rank = np.zeros(first_child.shape[0], dtype=np.int64)
+    leaf_rank[preorder] = np.arange(len(preorder))
+    order = np.argsort(leaf_rank[point_leaves], kind="stable")
+
+    stored = np.bincount(point_leaves, minlength=first_child.shape[0])
+    point_start = np.zeros(first_child.shape[0], dtype=np.int64)
+    point_end = np.zeros(first_child.shape[0], dtype=np.int64)
+    offset = 0
+    for node in preorder:
+        if first_child[node] < 0:
+            point_start[node], offset = offset, offset + stored[node]
+            point_end[node] = offset
+    for node in reversed(preorder):
+        if first_child[node] >= 0:
+            point_start[node] = point_start[first_child[node]]
+            point_end[node] = point_end[first_child[node] + 1]
+
+    return {
+        "points": points[order],
+        "point_start": point_start,
+        "point_end": point_end,
+    }
+
+
+def _read_only(array):
+    """
+    np.array -> np.array
+    Return a copy of an array that cannot be modified.
+    """
+    copy = np.array(array)
+    copy.flags.writeable = False
+    return copy
+
+
+def _aligned(size, alignment=64):
+    """
+    Int -> Int? -> Int
+    Round a number of bytes up to the nearest multiple of the alignment.
+    """
+    return -(-size // alignment) * alignment
+
+
+def _map_array(path, data_start, description):
+    """
+    String -> Int -> Dict -> np.array
+    Memory-map a single read-only array from a saved n-tree, given its entry
+    in the file's header.
+    """
+    shape = tuple(description["shape"])
+    if 0 in shape:
+        return np.empty(shape, dtype=description["dtype"])
+    return np.memmap(
+        path,
+        dtype=description["dtype"],
+        mode="r",
+        offset=data_start + description["offset"],
+        shape=shape,
+    )
@@ -1,5 +1,10 @@
 from numpy.random import normal
-from random import uniform
+from random import uniform, random
+from concurrent.futures import ProcessPoolExecutor
+from os import cpu_count
+from math import log1p, inf, exp, log, sqrt
+from maths.convergence import convergence_diagnostics
+import numpy as np
 
 
 def standard_gaussian_generator(n):
@@ -24,16 +29,304 @@ def gaussian_about(x):
     return normal(loc=x, size=len(x))
 
 
-def metropolis_hastings(iterations, f, x, Q=gaussian_about):
+def gaussian_about_each(xs):
     """
-    Int -> ([Float] -> Float) -> [Float] -> ([Float] -> [Float])? -> [Float]
+    np.array -> np.array
+    Return a sample from a multivariate Gaussian distribution with a standard
+    deviation of 1 centred on each row of the input array.
+    """
+    return normal(loc=xs)
+
+
+def gaussian_about_using(generator):
+    """
+    np.random.Generator -> ([Float] -> [Float])
+    Create a proposal distribution like `gaussian_about`, or like
+    `gaussian_about_each` when given a batch of points, which draws from the
+    given numpy random generator rather than the global random state.
+    """
+
+    def gaussian_about_point(x):
+        return generator.normal(loc=x)
+
+    return gaussian_about_point
+
+
+class MetropolisHastingsChain:
+    def __init__(self, f, x, Q=None, log_density=False, generator=None):
+        """
+        ([Float] -> Float) -> [Float] -> ([Float] -> [Float])? -> Bool?
+            -> np.random.Generator? -> MetropolisHastingsChain
+        Create a Markov chain which samples from the distribution f, starting at
+        the point x, using the Metropolis-Hastings algorithm with a symmetric
+        proposal distribution Q, which is `gaussian_about` by default.  The
+        density of the chain's current point is kept, so f is only evaluated
+        once per proposal.  If the log density flag is set, f is taken to return
+        the logarithm of the density instead, which avoids underflow for very
+        small densities.  A numpy random generator may be given, in which case it
+        is used for every random choice the chain makes, including the default
+        proposals, making the chain reproducible; otherwise the global random
+        state is used.
+        """
+        self.f = f
+        self.generator = generator
+        self.Q = Q if Q is not None else self._default_proposal()
+        self.log_density = log_density
+
+        self.x = x
+        self.density = f(x)
+
+        self.iterations = 0
+        self.evaluations = 1
+        self.accepted = 0
+
+    def step(self):
+        """
+        () -> [Float]
+        Advance the chain by one iteration, returning its new point.
+        """
+        x_dash = self.Q(self.x)
+        density = self.f(x_dash)
+        self.iterations += 1
+        self.evaluations += 1
+
+        if self._accept(density):
+            self.x, self.density = x_dash, density
+            self.accepted += 1
+        return self.x
+
+    def run(self, iterations):
+        """
+        Int -> [Float]
+        Advance the chain by a number of iterations, returning its final point.
+        """
+        for _ in range(iterations):
+            self.step()
+        return self.x
+
+    def _accept(self, proposal_density):
+        """
+        Float -> Bool
+        Decide whether to move to a proposed point given its density.  A chain
+        whose current point has zero density accepts any proposal.
+        """
+        u = random() if self.generator is None else self.generator.random()
+        if self.log_density:
+            if self.density == -inf:
+                return True
+            return log1p(-u) <= proposal_density - self.density
+        else:
+            return u * self.density <= proposal_density
+
+    def _default_proposal(self):
+        """
+        () -> ([Float] -> [Float])
+        Return the proposal distribution used when none is given.
+        """
+        if self.generator is None:
+            return gaussian_about
+        return gaussian_about_using(self.generator)
+
+    @property
+    def diagnostics(self):
+        """
+        () -> Dict
+        Return a JSON-like summary of the work done by the chain so far.
+        """
+        return {
+            "iterations": self.iterations,
+            "evaluations": self.evaluations,
+            "accepted": self.accepted,
+            "acceptanceRate": self.accepted / max(self.iterations, 1),
+            "evaluationsPerAcceptedSample": (
+                self.evaluations / self.accepted if self.accepted > 0 else inf
+            ),
+        }
+
+    def to_json(self):
+        """
+        () -> Dict
+        Return a JSON-like checkpoint of the chain's state, from which it can be
+        resumed with `from_json`.
+        """
+        json = {
+            "x": [float(xi) for xi in self.x],
+            "density": float(self.density),
+            "logDensity": self.log_density,
+            "iterations": self.iterations,
+            "evaluations": self.evaluations,
+            "accepted": self.accepted,
+        }
+        if self.generator is not None:
+            json["generator"] = self.generator.bit_generator.state
+        return json
+
+    @staticmethod
+    def from_json(json, f, Q=None):
+        """
+        Dict -> ([Float] -> Float) -> ([Float] -> [Float])? -> MetropolisHastingsChain
+        Resume a chain from a checkpoint, given the distribution it samples and
+        its proposal distribution, which cannot be stored.  The density of the
+        chain's point is restored rather than recalculated, as is the state of
+        its random generator if it had one.  A stream of samples taken from the
+        chain before the checkpoint is continued by passing the resume flag to
+        `mcmc_sample_stream`.
+        """
+        chain = MetropolisHastingsChain.__new__(MetropolisHastingsChain)
+        chain.f = f
+        chain.generator = _generator_from_json(json)
+        chain.Q = Q if Q is not None else chain._default_proposal()
+        chain.log_density = json["logDensity"]
+        chain.x = np.array(json["x"])
+        chain.density = json["density"]
+        chain.iterations = json["iterations"]
+        chain.evaluations = json["evaluations"]
+        chain.accepted = json["accepted"]
+        return chain
+
+
+class BatchedMetropolisHastingsChains:
+    def __init__(self, f, xs, Q=None, log_density=False, generator=None):
+        """
+        (np.array -> np.array) -> np.array -> (np.array -> np.array)? -> Bool?
+            -> np.random.Generator? -> BatchedMetropolisHastingsChains
+        Create a batch of independent Markov chains, one starting from each row
+        of the input array, which are advanced together using the
+        Metropolis-Hastings algorithm with the proposal distribution Q, which is
+        `gaussian_about_each` by default.  As with `MetropolisHastingsChain`, the
+        density of each chain's current point is kept between steps, and a numpy
+        random generator may be given to make the chains reproducible.
+        """
+        self.f = f
+        self.generator = generator
+        self.Q = Q if Q is not None else self._default_proposal()
+        self.log_density = log_density
+
+        self.xs = np.array(xs, dtype=np.float64)
+        self.densities = f(self.xs)
+
+        self.iterations = 0
+        self.evaluations = self.xs.shape[0]
+        self.accepted = np.zeros(self.xs.shape[0], dtype=np.int64)
+
+    def step(self):
+        """
+        () -> np.array
+        Advance every chain by one iteration, returning their new points.
+        """
+        self.xs, self.densities, accepted = _batched_step(
+            self.f,
+            self.Q,
+            self.xs,
+            self.densities,
+            self.log_density,
+            generator=self.generator,
+        )
+        self.iterations += 1
+        self.evaluations += self.xs.shape[0]
+        self.accepted += accepted
+        return self.xs
+
+    def run(self, iterations):
+        """
+        Int -> np.array
+        Advance every chain by a number of iterations, returning their final
+        points.
+        """
+        for _ in range(iterations):
+            self.step()
+        return self.xs
+
+    def _default_proposal(self):
+        """
+        () -> (np.array -> np.array)
+        Return the proposal distribution used when none is given.
+        """
+        if self.generator is None:
+            return gaussian_about_each
+        return gaussian_about_using(self.generator)
+
+    @property
+    def diagnostics(self):
+        """
+        () -> Dict
+        Return a JSON-like summary of the work done by the chains so far.
+        """
+        accepted = int(np.sum(self.accepted))
+        return {
+            "chains": self.xs.shape[0],
+            "iterations": self.iterations,
+            "evaluations": self.evaluations,
+            "accepted": accepted,
+            "acceptanceRate": accepted / max(self.iterations * self.xs.shape[0], 1),
+            "evaluationsPerAcceptedSample": (
+                self.evaluations / accepted if accepted > 0 else inf
+            ),
+        }
+
+    def to_json(self):
+        """
+        () -> Dict
+        Return a JSON-like checkpoint of the state of the chains, from which they
+        can be resumed with `from_json`.
+        """
+        json = {
+            "xs": self.xs.tolist(),
+            "densities": self.densities.tolist(),
+            "logDensity": self.log_density,
+            "iterations": self.iterations,
+            "evaluations": self.evaluations,
+            "accepted": self.accepted.tolist(),
+        }
+        if self.generator is not None:
+            json["generator"] = self.generator.bit_generator.state
+        return json
+
+    @staticmethod
+    def from_json(json, f, Q=None):
+        """
+        Dict -> (np.array -> np.array) -> (np.array -> np.array)?
+            -> BatchedMetropolisHastingsChains
+        Resume a batch of chains from a checkpoint, given the distribution they
+        sample and their proposal distribution, which cannot be stored.  The
+        state of their random generator is restored if they had one.
+        """
+        chains = BatchedMetropolisHastingsChains.__new__(
+            BatchedMetropolisHastingsChains
+        )
+        chains.f = f
+        chains.generator = _generator_from_json(json)
+        chains.Q = Q if Q is not None else chains._default_proposal()
+        chains.log_density = json["logDensity"]
+        chains.xs = np.array(json["xs"], dtype=np.float64)
+        chains.densities = np.array(json["densities"], dtype=np.float64)
+        chains.iterations = json["iterations"]
+        chains.evaluations = json["evaluations"]
+        chains.accepted = np.array(json["accepted"], dtype=np.int64)
+        return chains
+
+
+def _generator_from_json(json):
+    """
+    Dict -> np.random.Generator?
+    Recreate the random generator saved in the checkpoint of a chain, if it
+    had one.
+    """
+    if "generator" not in json:
+        return None
+    bit_generator = getattr(np.random, json["generator"]["bit_generator"])()
+    bit_generator.state = json["generator"]
+    return np.random.Generator(bit_generator)
+
+
+def metropolis_hastings(iterations, f, x, Q=gaussian_about, log_density=False):
+    """
+    Int -> ([Float] -> Float) -> [Float] -> ([Float] -> [Float])? -> Bool?
+        -> [Float]
     Iterate the Metropolis-Hastings algorithm n times on the given starting
     point for the objective function f.
     """
-    _x = x
-    for _ in range(iterations):
-        _x = iterate_metropolis_hastings(f, Q, _x)
-    return _x
+    return MetropolisHastingsChain(f, x, Q=Q, log_density=log_density).run(iterations)
 
 
 def iterate_metropolis_hastings(f, Q, x):
@@ -49,16 +342,543 @@ def iterate_metropolis_hastings(f, Q, x):
     return x if u > acceptance_ratio else x_dash
 
 
-def mcmc_samples(f, samples, gap, burn_in, start):
+def batched_metropolis_hastings(
+    iterations, f, xs, Q=gaussian_about_each, log_density=False
+):
     """
-    ([Float] -> Float) -> Int -> Int -> Int -> [Float] -> [[Float]]
+    Int -> (np.array -> np.array) -> np.array -> (np.array -> np.array)? -> Bool?
+        -> np.array
+    Iterate the Metropolis-Hastings algorithm n times on a batch of independent
+    chains at once, given as the rows of an array of their starting points.  The
+    objective function f should take an array of points and return an array
+    of their densities, or of their log densities if the flag is set.
+    """
+    return BatchedMetropolisHastingsChains(f, xs, Q=Q, log_density=log_density).run(
+        iterations
+    )
+
+
+def iterate_batched_metropolis_hastings(f, Q, xs, densities, log_density=False):
+    """
+    (np.array -> np.array) -> (np.array -> np.array) -> np.array -> np.array
+        -> Bool? -> (np.array, np.array)
+    Advance every chain in a batch by one step of the Metropolis-Hastings
+    algorithm, given the current point of each chain and its density.  The
+    proposal distribution Q is assumed to be symmetric.  Returns the new
+    points of the chains and their densities.
+    """
+    xs, densities, _ = _batched_step(f, Q, xs, densities, log_density)
+    return xs, densities
+
+
+def _batched_step(f, Q, xs, densities, log_density, generator=None):
+    """
+    (np.array -> np.array) -> (np.array -> np.array) -> np.array -> np.array
+        -> Bool -> np.random.Generator? -> (np.array, np.array, np.array)
+    Advance every chain in a batch by one step of the Metropolis-Hastings
+    algorithm, returning the new points and densities of the chains along
+    with a boolean array recording which proposals were accepted.  Acceptance
+    is decided using the given random generator, or the global random state.
+    """
+    proposals = Q(xs)
+    proposal_densities = f(proposals)
+    u = (np.random if generator is None else generator).uniform(size=xs.shape[0])
+    if log_density:
+        accepted = (densities == -np.inf) | (
+            np.log1p(-u) <= proposal_densities - densities
+        )
+    else:
+        accepted = u * densities <= proposal_densities
+    return (
+        np.where(accepted[:, np.newaxis], proposals, xs),
+        np.where(accepted, proposal_densities, densities),
+        accepted,
+    )
+
+
+def mcmc_samples(
+    f, samples, gap, burn_in, start, log_density=False, return_diagnostics=False
+):
+    """
+    ([Float] -> Float) -> Int -> Int -> Int -> [Float] -> Bool? -> Bool?
+        -> Either [[Float]] ([[Float]], Dict)
     Take a set number of samples, discarding some in between, from a distribution f
     using the Metropolis-Hastings algorithm.  The first samples drawn are thrown
-    away as part of a burn-in.
+    away as part of a burn-in.  Optionally, diagnostics describing the chain
+    are returned alongside the samples.
     """
-    output = [metropolis_hastings(burn_in, f, start)]
+    chain = MetropolisHastingsChain(f, start, log_density=log_density)
+    output = list(mcmc_sample_stream(chain, gap, burn_in=burn_in, samples=samples))
+    return (output, chain.diagnostics) if return_diagnostics else output
+
+
+def batched_mcmc_samples(f, samples, gap, burn_in, starts, log_density=False):
+    """
+    (np.array -> np.array) -> Int -> Int -> Int -> np.array -> Bool? -> np.array
+    Take a set number of samples from each of a batch of independent chains,
+    which are advanced together, from a distribution f using the
+    Metropolis-Hastings algorithm.  As with `mcmc_samples`, the first entry
+    is the state of the chains after burn-in, and is followed by the samples,
+    giving an array of shape (samples + 1, chains, dimensions).
+    """
+    chains = BatchedMetropolisHastingsChains(f, starts, log_density=log_density)
+    return np.array(
+        list(mcmc_sample_stream(chains, gap, burn_in=burn_in, samples=samples))
+    )
+
+
+def parallel_mcmc_samples(
+    f, samples, gap, burn_in, starts, seed=None, workers=None, log_density=False
+):
+    """
+    ([Float] -> Float) -> Int -> Int -> Int -> [[Float]] -> Int? -> Int? -> Bool?
+        -> np.array
+    Take samples from one independent chain per starting point, as with
+    `mcmc_samples`, spreading the chains over separate processes.  This suits
+    distributions which can only be evaluated one point at a time, and must be
+    picklable, such as a function defined at the top level of a module.  Each
+    chain draws from its own random generator, spawned from a seed sequence, so
+    the output depends only on the seed and not on the number of workers.  By
+    default, one process is used per CPU.  Returns an array of shape
+    (samples + 1, chains, dimensions).
+    """
+    seeds = np.random.SeedSequence(seed).spawn(len(starts))
+    arguments = [
+        (f, samples, gap, burn_in, start, chain_seed, log_density)
+        for start, chain_seed in zip(starts, seeds)
+    ]
+    workers = cpu_count() if workers is None else workers
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as executor:
+            chains = list(
+                executor.map(
+                    _run_seeded_chain,
+                    arguments,
+                    chunksize=max(len(arguments) // (4 * workers), 1),
+                )
+            )
+    else:
+        chains = [_run_seeded_chain(chain_arguments) for chain_arguments in arguments]
+    return np.stack(chains, axis=1)
+
+
+def _run_seeded_chain(arguments):
+    """
+    (([Float] -> Float), Int, Int, Int, [Float], np.random.SeedSequence, Bool)
+        -> np.array
+    Take samples from a single chain whose random choices are all drawn from a
+    generator seeded by the given seed sequence.
+    """
+    f, samples, gap, burn_in, start, seed, log_density = arguments
+    chain = MetropolisHastingsChain(
+        f,
+        np.array(start, dtype=np.float64),
+        log_density=log_density,
+        generator=np.random.Generator(np.random.PCG64(seed)),
+    )
+    return np.array(
+        list(mcmc_sample_stream(chain, gap, burn_in=burn_in, samples=samples))
+    )
+
+
+def mcmc_sample_stream(chain, gap, burn_in=0, samples=None, resume=False):
+    """
+    Either MetropolisHastingsChain BatchedMetropolisHastingsChains -> Int -> Int?
+        -> Int? -> Bool? -> Iterator (Either [Float] np.array)
+    Lazily take samples from a chain, or a batch of chains, yielding its point
+    once the burn-in is complete and then again after every `gap` iterations.
+    If a number of samples is given, the stream ends after that many samples
+    have followed the first point; otherwise it continues indefinitely.  The
+    chain holds all of the stream's state, so it may be checkpointed between
+    samples.  To continue a stream from a resumed chain, set the resume flag:
+    the burn-in and the first point, which was the last sample yielded before
+    the checkpoint, are then skipped.
+    """
+    if not resume:
+        yield chain.run(burn_in)
+    taken = 0
+    while samples is None or taken < samples:
+        yield chain.run(gap)
+        taken += 1
+
+
+class AdaptiveGaussianProposal:
+    def __init__(
+        self,
+        dimension,
+        initial_scale=0.1,
+        target_acceptance=0.234,
+        full_covariance=False,
+        regularisation=1e-6,
+    ):
+        """
+        Int -> Float? -> Float? -> Bool? -> Float? -> AdaptiveGaussianProposal
+        Create a random-walk proposal distribution for a batch of chains whose
+        shape is learned while the chains burn in.  The proposal covariance is
+        an estimate of the target's covariance, taken from every point visited
+        by the chains so far, which is diagonal unless a full covariance is
+        requested.  It is multiplied by a global scale which is tuned towards a
+        target acceptance rate.  Until enough points have been seen, the
+        proposal has the initial standard deviation in every dimension.
+        """
+        self.dimension = dimension
+        self.initial_scale = initial_scale
+        self.target_acceptance = target_acceptance
+        self.full_covariance = full_covariance
+        self.regularisation = regularisation
+
+        self.log_scale = log(2.38 / sqrt(dimension))
+        self.adaptations = 0
+
+        self.count = 0
+        self.mean = np.zeros(dimension)
+        self.scatter = (
+            np.zeros([dimension, dimension]) if full_covariance else np.zeros(dimension)
+        )
+        # matrix, or vector of per-dimension standard deviations, by which
+        # standard Gaussian steps are transformed before being scaled
+        self.shape = (
+            initial_scale * np.eye(dimension)
+            if full_covariance
+            else np.full(dimension, initial_scale)
+        )
+
+    def __call__(self, xs):
+        """
+        np.array -> np.array
+        Return a proposal for each row of the input array.
+        """
+        steps = normal(size=xs.shape)
+        if self.full_covariance:
+            steps = np.dot(steps, self.shape.T)
+        else:
+            steps = steps * self.shape
+        return xs + exp(self.log_scale) * steps
+
+    def adapt(self, xs, accepted):
+        """
+        np.array -> np.array -> ()
+        Update the proposal given the points of the chains after a step and
+        which of their proposals were accepted.
+        """
+        self.adaptations += 1
+        self.log_scale += (
+            np.mean(accepted) - self.target_acceptance
+        ) / self.adaptations**0.6
+
+        n = xs.shape[0]
+        batch_mean = np.mean(xs, axis=0)
+        deviations = xs - batch_mean
+        delta = batch_mean - self.mean
+        total = self.count + n
+        if self.full_covariance:
+            self.scatter += np.dot(deviations.T, deviations) + np.outer(
+                delta, delta
+            ) * (self.count * n / total)
+        else:
+            self.scatter += np.sum(np.square(deviations), axis=0) + np.square(delta) * (
+                self.count * n / total
+            )
+        self.mean += delta * (n / total)
+        self.count = total
+
+        if self.count > 10 * self.dimension:
+            covariance = self.scatter / (self.count - 1)
+            if self.full_covariance:
+                self.shape = np.linalg.cholesky(
+                    covariance + self.regularisation * np.eye(self.dimension)
+                )
+            else:
+                self.shape = np.sqrt(covariance + self.regularisation)
+
+    @property
+    def scales(self):
+        """
+        () -> np.array
+        Return the current standard deviation of proposals in each dimension.
+        """
+        if self.full_covariance:
+            return exp(self.log_scale) * np.sqrt(np.sum(np.square(self.shape), axis=1))
+        else:
+            return exp(self.log_scale) * self.shape
+
+
+def adaptive_batched_mcmc_samples(
+    f, samples, gap, burn_in, starts, log_density=False, proposal=None
+):
+    """
+    (np.array -> np.array) -> Int -> Int -> Int -> np.array -> Bool?
+        -> AdaptiveGaussianProposal? -> np.array
+    Take samples from a batch of chains as with `batched_mcmc_samples`, but
+    adapt the proposal distribution to the target during the burn-in.  The
+    proposal is fixed once the burn-in is complete, so the samples which
+    follow are drawn from a valid Markov chain.  A proposal may be given to
+    configure the adaptation or to inspect the learned scales afterwards.
+    """
+    xs = np.array(starts, dtype=np.float64)
+    densities = f(xs)
+    Q = proposal if proposal is not None else AdaptiveGaussianProposal(xs.shape[1])
+
+    for _ in range(burn_in):
+        xs, densities, accepted = _batched_step(f, Q, xs, densities, log_density)
+        Q.adapt(xs, accepted)
+
+    output = [xs]
     for _ in range(samples):
-        output.append(metropolis_hastings(gap, f, output[-1]))
+        for _ in range(gap):
+            xs, densities, _ = _batched_step(f, Q, xs, densities, log_density)
+        output.append(xs)
+    return np.array(output)
+
+
+def mcmc_samples_until_converged(
+    sample, starts, target_ess, max_samples, check_every=4, r_hat_threshold=1.01
+):
+    """
+    (np.array -> Int -> np.array) -> np.array -> Float -> Int -> Int? -> Float?
+        -> (np.array, Dict)
+    Advance a batch of chains from their starting points until they appear to
+    have converged, taking `check_every` samples from each chain at a time.  The
+    sample function should continue the chains from the given points and return
+    the requested number of samples as an array of shape (samples, chains,
+    dimensions).  After each batch of samples, the first half of all samples so
+    far is discarded as burn-in and the remainder is diagnosed; sampling stops
+    once its effective sample size, pooled over the chains, reaches the target
+    and its split R-hat falls below the threshold, or once the maximum number of
+    samples has been taken.  Chains which are stuck have an effective sample
+    size of zero and an undefined split R-hat, so are never taken to have
+    converged.  Returns every sample along with the diagnostics of the retained
+    half, which records whether the chains converged.
+    """
+    xs = np.array(starts, dtype=np.float64)
+    batches = []
+    taken = 0
+    converged = False
+    diagnostics = {}
+    while taken < max_samples and not converged:
+        batch = sample(xs, min(check_every, max_samples - taken))
+        batches.append(batch)
+        taken += batch.shape[0]
+        xs = batch[-1]
+
+        if taken - taken // 2 >= 4:
+            diagnostics = convergence_diagnostics(np.concatenate(batches)[taken // 2 :])
+            converged = (
+                diagnostics["effectiveSampleSize"] >= target_ess
+                and diagnostics["splitRHat"] <= r_hat_threshold
+            )
+
+    diagnostics["converged"] = converged
+    return np.concatenate(batches), diagnostics
+
+
+def batched_mcmc_samples_until_converged(
+    f, target_ess, gap, starts, max_samples, log_density=False, check_every=4
+):
+    """
+    (np.array -> np.array) -> Float -> Int -> np.array -> Int -> Bool? -> Int?
+        -> (np.array, Dict)
+    Take samples from a batch of chains, `gap` iterations apart, with the
+    Metropolis-Hastings algorithm until they reach a target effective sample
+    size, as described in `mcmc_samples_until_converged`.  No separate burn-in
+    is needed, since the first half of the samples is discarded for diagnosis.
+    """
+    return mcmc_samples_until_converged(
+        lambda xs, n: batched_mcmc_samples(f, n, gap, 0, xs, log_density=log_density)[
+            1:
+        ],
+        starts,
+        target_ess,
+        max_samples,
+        check_every=check_every,
+    )
+
+
+def independence_batched_mcmc_samples(
+    f,
+    propose,
+    proposal_density,
+    samples,
+    gap,
+    burn_in,
+    starts,
+    log_density=False,
+    steps_per_batch=64,
+):
+    """
+    (np.array -> np.array) -> (Int -> np.array) -> (np.array -> np.array) -> Int
+        -> Int -> Int -> np.array -> Bool? -> Int? -> np.array
+    Take samples from a batch of chains as with `batched_mcmc_samples`, using
+    an independence sampler whose proposals are drawn from a fixed distribution
+    regardless of each chain's current point.  The proposal function should
+    return the given number of points, and the proposal density function the
+    density of the proposal distribution at each of a batch of points, which
+    should be positive at the starting points.  Proposals for several steps of
+    every chain are drawn and evaluated together, so each function is called
+    once for every `steps_per_batch` steps.
+    """
+    xs = np.array(starts, dtype=np.float64)
+    chains, dimension = xs.shape
+    log_weights = _log_importance_weights(f(xs), proposal_density(xs), log_density)
+    schedule = [burn_in] + [gap] * samples
+
+    def proposal_batches():
+        remaining = sum(schedule)
+        while remaining > 0:
+            steps = min(steps_per_batch, remaining)
+            proposals = np.reshape(propose(steps * chains), [-1, dimension])
+            proposal_log_weights = _log_importance_weights(
+                f(proposals), proposal_density(proposals), log_density
+            )
+            for i in range(steps):
+                yield (
+                    proposals[i * chains : (i + 1) * chains],
+                    proposal_log_weights[i * chains : (i + 1) * chains],
+                )
+            remaining -= steps
+
+    batches = proposal_batches()
+    output = []
+    for iterations in schedule:
+        for _ in range(iterations):
+            proposals, proposal_log_weights = next(batches)
+            accepted = (log_weights == -np.inf) | (
+                np.log1p(-np.random.uniform(size=chains))
+                <= proposal_log_weights - log_weights
+            )
+            xs = np.where(accepted[:, np.newaxis], proposals, xs)
+            log_weights = np.where(accepted, proposal_log_weights, log_weights)
+        output.append(xs)
+    return np.array(output)
+
+
+def defensive_mixture(propose, proposal_density, ranges, weight=0.1):
+    """
+    (Int -> np.array) -> (np.array -> np.array) -> [(Float, Float)] -> Float?
+        -> (Int -> np.array, np.array -> np.array)
+    Mix a proposal distribution with the uniform distribution over the given
+    ranges, from which each proposal is drawn with the given probability, and
+    return functions drawing from and evaluating the density of the mixture.
+    The mixture has positive density throughout the ranges, so an independence
+    sampler using it can reach regions which the original proposal misses.
+    """
+    lower, upper = np.array(ranges, dtype=np.float64).T
+    uniform_density = 1.0 / np.prod(upper - lower)
+
+    def propose_from_mixture(n):
+        points = np.array(np.reshape(propose(n), [n, -1]), dtype=np.float64)
+        uniform = np.random.uniform(size=n) < weight
+        points[uniform] = np.random.uniform(
+            lower, upper, [np.count_nonzero(uniform), len(lower)]
+        )
+        return points
+
+    def mixture_density(points):
+        within_bounds = np.all((lower <= points) & (points <= upper), axis=1)
+        return (1 - weight) * proposal_density(points) + weight * np.where(
+            within_bounds, uniform_density, 0.0
+        )
+
+    return propose_from_mixture, mixture_density
+
+
+def _log_importance_weights(densities, proposal_densities, log_density):
+    """
+    np.array -> np.array -> Bool -> np.array
+    Return the log of the ratio between the target density and the proposal
+    density at each of a batch of points.
+    """
+    with np.errstate(divide="ignore"):
+        log_densities = densities if log_density else np.log(densities)
+        return log_densities - np.log(proposal_densities)
+
+
+def geometric_temperatures(count, maximum):
+    """
+    Int -> Float -> np.array
+    Return a ladder of temperatures, spaced geometrically from 1 up to the
+    given maximum, for use in parallel tempering.
+    """
+    return np.geomspace(1.0, maximum, count) if count > 1 else np.ones(1)
+
+
+def parallel_tempering_samples(
+    f,
+    samples,
+    gap,
+    burn_in,
+    starts,
+    temperatures=geometric_temperatures(8, 100.0),
+    step_size=0.1,
+    log_density=False,
+    return_swap_rates=False,
+):
+    """
+    (np.array -> np.array) -> Int -> Int -> Int -> np.array -> np.array?
+        -> Float? -> Bool? -> Bool? -> Either np.array (np.array, np.array)
+    Take samples from a batch of chains as with `batched_mcmc_samples`, where
+    each chain is replaced by a ladder of replicas targeting the distribution
+    raised to the inverse of each temperature, with the first temperature being
+    that of the distribution itself.  Every replica takes a random-walk step,
+    whose scale grows with the square root of its temperature, and the replicas
+    of every chain are evaluated by a single call to f.  Adjacent replicas then
+    propose to swap their points, alternating between even and odd pairs, which
+    lets points found by the hot replicas reach the others.  Only the points of
+    the first replica are returned; optionally, the acceptance rate of swaps
+    between each adjacent pair of temperatures is returned too.
+    """
+    xs = np.array(starts, dtype=np.float64)
+    chains, dimension = xs.shape
+    inverse_temperatures = 1.0 / np.array(temperatures, dtype=np.float64)
+    replicas = inverse_temperatures.shape[0]
+    scales = step_size * np.sqrt(np.array(temperatures, dtype=np.float64))
+
+    def log_f(points):
+        densities = f(np.reshape(points, [-1, dimension]))
+        if not log_density:
+            with np.errstate(divide="ignore"):
+                densities = np.log(densities)
+        return np.reshape(densities, [chains, replicas])
+
+    xs = np.repeat(xs[:, np.newaxis, :], replicas, axis=1)
+    log_densities = log_f(xs)
+    swaps_proposed = np.zeros(replicas - 1)
+    swaps_accepted = np.zeros(replicas - 1)
+    iteration = 0
+
+    output = []
+    for iterations in [burn_in] + [gap] * samples:
+        for _ in range(iterations):
+            proposals = xs + scales[:, np.newaxis] * normal(size=xs.shape)
+            proposal_log_densities = log_f(proposals)
+            accepted = (log_densities == -np.inf) | (
+                np.log1p(-np.random.uniform(size=log_densities.shape))
+                <= inverse_temperatures * (proposal_log_densities - log_densities)
+            )
+            xs = np.where(accepted[:, :, np.newaxis], proposals, xs)
+            log_densities = np.where(accepted, proposal_log_densities, log_densities)
+
+            lower = np.arange(iteration % 2, replicas - 1, 2)
+            upper = lower + 1
+            with np.errstate(invalid="ignore"):
+                swapped = np.log1p(
+                    -np.random.uniform(size=[chains, lower.shape[0]])
+                ) <= (inverse_temperatures[lower] - inverse_temperatures[upper]) * (
+                    log_densities[:, upper] - log_densities[:, lower]
+                )
+            order = np.tile(np.arange(replicas), [chains, 1])
+            order[:, lower] = np.where(swapped, upper, lower)
+            order[:, upper] = np.where(swapped, lower, upper)
+            xs = np.take_along_axis(xs, order[:, :, np.newaxis], axis=1)
+            log_densities = np.take_along_axis(log_densities, order, axis=1)
+            swaps_proposed[lower] += chains
+            swaps_accepted[lower] += np.sum(swapped, axis=0)
+            iteration += 1
+        output.append(xs[:, 0])
+
+    output = np.array(output)
+    if return_swap_rates:
+        return output, swaps_accepted / np.maximum(swaps_proposed, 1)
     return output
 
 
@@ -76,24 +896,42 @@ def tensorflow_mcmc(
     Take a number of samples from a target distribution, as defined by a
     tensorflow node.
     """
-    samples = []
-    samples.append(
-        metropolis_hastings(
-            burn_in,
-            lambda x: tensorflow_session.run(
-                distribution_output, feed_dict={distribution_input: x}
+    return mcmc_samples(
+        tensorflow_density(distribution_input, distribution_output, tensorflow_session),
+        n_samples,
+        skip,
+        burn_in,
+        start,
+    )
+
+
+def tensorflow_mcmc_stream(
+    distribution_input, distribution_output, tensorflow_session, burn_in, skip, start
+):
+    """
+    tf.Node -> tf.Node -> tf.Session -> Int -> Int -> [Float] -> Iterator [Float]
+    Lazily take samples from a target distribution, as defined by a tensorflow
+    node, as with `mcmc_sample_stream`.  To checkpoint the stream, create a chain
+    over `tensorflow_density` and stream from that instead.
+    """
+    return mcmc_sample_stream(
+        MetropolisHastingsChain(
+            tensorflow_density(
+                distribution_input, distribution_output, tensorflow_session
             ),
             start,
-        )
+        ),
+        skip,
+        burn_in=burn_in,
+    )
+
+
+def tensorflow_density(distribution_input, distribution_output, tensorflow_session):
+    """
+    tf.Node -> tf.Node -> tf.Session -> ([Float] -> Float)
+    Return a function evaluating a density, defined by a tensorflow node, at a
+    single point.
+    """
+    return lambda x: tensorflow_session.run(
+        distribution_output, feed_dict={distribution_input: x}
     )
-    for _ in range(n_samples):
-        samples.append(
-            metropolis_hastings(
-                skip,
-                lambda x: tensorflow_session.run(
-                    distribution_output, feed_dict={distribution_input: x}
-                ),
-                samples[-1],
-            )
-        )
-    return samples
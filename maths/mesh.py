@@ -3,85 +3,179 @@ import matplotlib.pyplot as plt
 
 
 class Mesh:
-    def __init__(self, x_range, y_range, x_bins=100, y_bins=100):
+    def __init__(self, ranges, bins=100):
+        """
+        [(Float, Float)] -> Either Int [Int] -> Mesh
+        Create a data class for quickly sampling from a regular grid spanning
+        the given range in each dimension.  The number of points along each
+        dimension may be given separately or shared by all dimensions.
+        """
+        self.ranges = [(float(lower), float(upper)) for lower, upper in ranges]
+        self.dimensions = len(self.ranges)
+        self.bins = (
+            tuple(int(b) for b in bins)
+            if isinstance(bins, (list, tuple, np.ndarray))
+            else (int(bins),) * self.dimensions
+        )
+
+        # the first two dimensions are referred to as x and y when plotting
+        if self.dimensions >= 2:
+            self.x_range, self.y_range = self.ranges[:2]
+            self.x_bins, self.y_bins = self.bins[:2]
+            self.x_min, self.x_max = self.x_range
+            self.y_min, self.y_max = self.y_range
+
+    @property
+    def key(self):
+        """
+        () -> ((Float, Float)..., (Int...))
+        Return a hashable value which is equal for meshes covering the same
+        points, for use in caching evaluations over a mesh.
+        """
+        return (tuple(self.ranges), self.bins)
+
+    def axis_points(self, dimension):
         """
-        (Float, Float) -> (Float, Float) -> Int? -> Int? -> Mesh
-        Create a data class for quickly sampling from a 2D grid.
+        Int -> np.array
+        Return an array of every coordinate taken by points of the mesh along
+        the given dimension.
         """
-        self.x_range = x_range
-        self.y_range = y_range
-        self.x_bins = x_bins
-        self.y_bins = y_bins
-        self.x_min, self.x_max = self.x_range
-        self.y_min, self.y_max = self.y_range
+        lower, upper = self.ranges[dimension]
+        return np.linspace(lower, upper, self.bins[dimension])
 
     @property
     def x_points(self):
         """
-        () -> [Float]
+        () -> np.array
         Return an array of points describing each x-coordinate in one
         row of the mesh.
         """
-        return np.linspace(self.x_min, self.x_max, self.x_bins)
+        return self.axis_points(0)
 
     @property
     def y_points(self):
         """
-        () -> [Float]
+        () -> np.array
         Return an array of points describing each y-coordinate in one
         column of the mesh.
         """
-        return np.linspace(self.y_min, self.y_max, self.y_bins)
+        return self.axis_points(1)
+
+    @property
+    def point_count(self):
+        """
+        () -> Int
+        Return the number of points in the mesh.
+        """
+        return int(np.prod(self.bins))
+
+    @property
+    def grid(self):
+        """
+        () -> np.array
+        Return every point of the mesh arranged in an array whose shape is the
+        number of bins in each dimension followed by the number of dimensions.
+        """
+        return np.stack(
+            np.meshgrid(
+                *[self.axis_points(d) for d in range(self.dimensions)], indexing="ij"
+            ),
+            axis=-1,
+        )
 
     @property
     def all_points(self):
         """
-        () -> [(Float, Float)]
-        Return a list of every point in the mesh in an arbitrary order.
+        () -> np.array
+        Return an array of every point in the mesh, one per row, ordered so
+        that the last dimension varies fastest.
         """
-        points = []
-        for x in self.x_points:
-            for y in self.y_points:
-                points.append((x, y))
-        return points
+        return np.reshape(self.grid, [-1, self.dimensions])
+
+    def chunks(self, chunk_size=65536):
+        """
+        Int? -> Iterator np.array
+        Lazily yield the points of the mesh, in the same order as `all_points`,
+        in arrays of at most the given number of rows, so that very dense meshes
+        need never be held in memory at once.
+        """
+        axes = [self.axis_points(d) for d in range(self.dimensions)]
+        for start in range(0, self.point_count, chunk_size):
+            indices = np.unravel_index(
+                np.arange(start, min(start + chunk_size, self.point_count)), self.bins
+            )
+            yield np.stack([axis[i] for axis, i in zip(axes, indices)], axis=1)
+
+    def evaluate(self, f, chunk_size=65536):
+        """
+        (np.array -> np.array) -> Int? -> np.array
+        Evaluate a batched function at every point of the mesh, one chunk of
+        points at a time, and return its values arranged in the shape of the
+        mesh.
+        """
+        return self.reshape(
+            np.concatenate([np.asarray(f(chunk)) for chunk in self.chunks(chunk_size)])
+        )
+
+    def reshape(self, values):
+        """
+        np.array -> np.array
+        Arrange values given for each point of the mesh, in the order of
+        `all_points`, into an array with one axis per dimension of the mesh.
+        """
+        return np.reshape(values, self.bins + np.shape(values)[1:])
+
+    def contours(self, dimension, values=None):
+        """
+        Int -> np.array? -> np.array
+        Return a series of lines, each consisting of points for which only the
+        value in the given dimension changes, increasing along the line.  The
+        result has shape (lines, points per line, dimensions).  If vectors
+        arranged in the shape of the mesh are given, such as the images of its
+        points under some mapping, they are split into lines in the same way.
+        """
+        grid = self.grid if values is None else np.asarray(values)
+        return np.reshape(
+            np.moveaxis(grid, dimension, -2),
+            [-1, self.bins[dimension], grid.shape[-1]],
+        )
 
     @property
     def bin_size(self):
         """
-        () -> (Float, Float)
+        () -> (Float...)
         Return the bin size of the mesh.
         """
-        return (
-            (self.x_max - self.x_min) / self.x_bins,
-            (self.y_max - self.y_min) / self.y_bins,
+        return tuple(
+            (upper - lower) / bins
+            for (lower, upper), bins in zip(self.ranges, self.bins)
         )
 
     @property
     def half_bin_size(self):
         """
-        () -> (Float, Float)
+        () -> (Float...)
         Return half the bin size in each dimension.
         """
-        x, y = self.bin_size
-        return 0.5 * x, 0.5 * y
+        return tuple(0.5 * size for size in self.bin_size)
 
     @property
     def x_contours(self):
         """
-        () -> [[(Float, Float)]]
+        () -> np.array
         Return a series of lines, each consisting of points for which the
         x-value is kept constant while the y-value increases.
         """
-        return [[(x, y) for y in self.y_points] for x in self.x_points]
+        return self.contours(1)
 
     @property
     def y_contours(self):
         """
-        () -> [[(Float, Float)]]
+        () -> np.array
         Return a series of lines, each consisting of points for which the
         y-value is kept constant while the x-value increases.
         """
-        return [[(x, y) for x in self.x_points] for y in self.y_points]
+        return self.contours(0)
 
     def increase_density(self, times):
         """
@@ -89,19 +183,17 @@ class Mesh:
         Return a new mesh which has the given number of times more bins
         in each dimension than this mesh.
         """
-        return Mesh(
-            self.x_range, self.y_range, self.x_bins * times, self.y_bins * times
-        )
+        return Mesh(self.ranges, [bins * times for bins in self.bins])
 
     def bound_pyplot(self):
         """
         () -> ()
         Set the bounds of the current matplotlib plot to the bounds of
-        the mesh.
+        the first two dimensions of the mesh.
         """
         plt.xlim(self.x_min, self.x_max)
         plt.ylim(self.y_min, self.y_max)
 
 
-Mesh.unit = Mesh((0.0, 1.0), (0.0, 1.0))
-Mesh.double = Mesh((-1.0, 1.0), (-1.0, 1.0))
+Mesh.unit = Mesh([(0.0, 1.0), (0.0, 1.0)])
+Mesh.double = Mesh([(-1.0, 1.0), (-1.0, 1.0)])
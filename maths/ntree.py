@@ -1,7 +1,14 @@
+from maths.frozenntree import FrozenNTree
+from concurrent.futures import ProcessPoolExecutor
+from os import cpu_count
 import matplotlib.pyplot as plt
+import numpy as np
 
 
 class NTree:
+
+    split_policies = ["midpoint", "median", "variance"]
+
     def __init__(
         self,
         ranges,
@@ -10,22 +17,61 @@ class NTree:
         points=[],
         minimum_width=0.001,
         parent=None,
+        split_policy="midpoint",
+        reservoir_size=None,
+        point_count=None,
+        maximum_buckets=None,
     ):
         """
-        [(Float, Float)] -> Int -> Int? -> [[Float]]? -> Float? -> NTree? -> NTree
+        [(Float, Float)] -> Int -> Int? -> [[Float]]? -> Float? -> NTree?
+            -> String? -> Int? -> Int? -> Int? -> NTree
         Create an n-tree, which stores points in buckets of variable density.
-        """
+
+        The split policy determines where overcrowded buckets are divided.
+        "midpoint" bisects the range of each dimension in turn; "median" splits
+        each dimension in turn at the median of the bucket's points; and
+        "variance" splits at the median of whichever dimension the bucket's
+        points vary along the most.
+
+        If a reservoir size is given, the tree only counts its points, and each
+        bucket keeps no more than that many of them, sampled uniformly, to
+        decide where to split.  Such a bucket is only split once its sample
+        puts at least two points on each side of the split, and the counts of
+        its children are estimated from that sample.  A point count may be
+        given to override the number of initial points in this case.
+
+        Buckets otherwise keep splitting as points arrive, so a tree which only
+        counts its points still grows with the number of points added.  If a
+        maximum number of buckets is given, no bucket is split once the tree
+        has that many, bounding its memory by the number of buckets times the
+        reservoir size.
+        """
+        if split_policy not in NTree.split_policies:
+            raise ValueError("unknown split policy '{}'".format(split_policy))
+        if reservoir_size is not None and reservoir_size < 4:
+            raise ValueError("reservoir size must be at least 4")
+
         self.ranges = ranges
         self.dimensions = len(self.ranges)
         self.split_dimension = split_dimension
+        self.split_policy = split_policy
+        self._split_point = None
 
         self.capacity = capacity
         self.minimum_width = minimum_width
+        self.reservoir_size = reservoir_size
+        self.maximum_buckets = maximum_buckets
+        self._bucket_count = 1
 
-        self.points = points
+        self.points = list(points)
+        self._point_count = len(self.points) if point_count is None else point_count
+        if reservoir_size is not None and len(self.points) > reservoir_size:
+            kept = np.random.choice(len(self.points), reservoir_size, replace=False)
+            self.points = [self.points[i] for i in kept]
 
         self.first_child, second_child = None, None
         self.has_children = False
+        self._frozen, self._frozen_with_points = None, None
 
         self.parent = parent
         self.check_for_overcrowding()
@@ -51,14 +97,84 @@ class NTree:
         else:
             points = new_points
 
+        self._point_count += len(points)
+        self._frozen, self._frozen_with_points = None, None
         if self.has_children:
             first_points, second_points = self._sort_by_child(points)
             self.first_child.add_points(first_points)
             self.second_child.add_points(second_points)
+        elif self.reservoir_size is not None:
+            self._add_to_reservoir(points, self._point_count - len(points))
+            self.check_for_overcrowding()
         else:
             self.points += points
             self.check_for_overcrowding()
 
+    def _add_to_reservoir(self, points, previously_seen):
+        """
+        [[Float]] -> Int -> ()
+        Update the bucket's uniform sample of its points with a batch of new
+        points, given the number of points the bucket had already seen.  Each
+        new point is kept with probability equal to the reservoir size over the
+        number of points seen so far, filling a free slot if there is one and
+        otherwise replacing a random member of the reservoir.  The reservoir of
+        a bucket created by a split may have free slots even though it has seen
+        many points, since its count is estimated from a smaller sample.
+        """
+        seen = previously_seen + np.arange(len(points)) + 1
+        slots = np.random.randint(0, seen)
+        for i in np.flatnonzero(slots < self.reservoir_size):
+            if len(self.points) < self.reservoir_size:
+                self.points.append(points[i])
+            else:
+                self.points[slots[i]] = points[i]
+
+    def merge(self, other):
+        """
+        NTree -> ()
+        Add all the points of another n-tree, covering the same region, to this
+        one.  Because midpoint splits depend only on the bounds of a bucket, the
+        structure and counts of the result match those of a single tree built
+        from both sets of points.  The other tree's buckets are reused, so it
+        should not be used afterwards.
+        """
+        if self.split_policy != "midpoint" or other.split_policy != "midpoint":
+            raise ValueError("only n-trees with midpoint splits can be merged")
+        if self.reservoir_size is not None or other.reservoir_size is not None:
+            raise ValueError("n-trees which only count their points cannot be merged")
+        if self.maximum_buckets is not None or other.maximum_buckets is not None:
+            raise ValueError("n-trees with a bucket limit cannot be merged")
+        if (
+            self.ranges != other.ranges
+            or self.split_dimension != other.split_dimension
+            or self.capacity != other.capacity
+            or self.minimum_width != other.minimum_width
+        ):
+            raise ValueError("cannot merge n-trees with different parameters")
+        self._frozen, self._frozen_with_points = None, None
+        self._merge_inner(other)
+
+    def _merge_inner(self, other):
+        """
+        NTree -> ()
+        Merge another n-tree into this one, assuming that their bounds and
+        splitting parameters match.
+        """
+        if not other.has_children:
+            self.add_points(other.points)
+        elif not self.has_children:
+            points = self.points
+            self.has_children = True
+            self.points = None
+            self._point_count = other.point_count
+            self.first_child, self.second_child = other.first_child, other.second_child
+            self.first_child.parent, self.second_child.parent = self, self
+            self.add_points(points)
+        else:
+            self._point_count += other.point_count
+            self.first_child._merge_inner(other.first_child)
+            self.second_child._merge_inner(other.second_child)
+
     def check_for_overcrowding(self):
         """
         () -> ()
@@ -66,12 +182,68 @@ class NTree:
         split it into two smaller child buckets and redistribute the points to
         them.
         """
-        can_subdivide = (
-            self.ranges[self.split_dimension][1]
-            > self.ranges[self.split_dimension][0] + self.minimum_width
+        if self.point_count > self.capacity and self._may_split:
+            split = self._choose_split()
+            if split is not None and self._sample_divides(*split):
+                self.split_dimension, self._split_point = split
+                self._create_children()
+
+    @property
+    def _may_split(self):
+        """
+        () -> Bool
+        Determine whether the enclosing tree has room for another bucket.
+        """
+        return (
+            self.maximum_buckets is None
+            or self.enclosing_tree._bucket_count < self.maximum_buckets
         )
-        if self.point_count > self.capacity and can_subdivide:
-            self._create_children()
+
+    def _sample_divides(self, dimension, split_point):
+        """
+        Int -> Float -> Bool
+        Determine whether the points stored by a bucket which only counts its
+        points are spread widely enough to estimate the counts of its children
+        if it were split at the given point.  Otherwise, a child could be given
+        a large estimated count but a sample of only one point, which would
+        then be passed whole to one of its own children at every later split.
+        """
+        if self.reservoir_size is None:
+            return True
+        below = sum(point[dimension] < split_point for point in self.points)
+        return below >= 2 and len(self.points) - below >= 2
+
+    def _choose_split(self):
+        """
+        () -> (Int, Float)?
+        Choose the dimension along which, and the point at which, the bucket
+        should be split according to its split policy.  Returns None if no
+        dimension is wide enough to be subdivided.
+        """
+        if self.split_policy == "variance":
+            widths = [u - l for l, u in self.ranges]
+            variances = np.var(np.array(self.points), axis=0)
+            candidates = [
+                i for i in range(self.dimensions) if widths[i] > self.minimum_width
+            ]
+            if len(candidates) == 0:
+                return None
+            dimension = max(candidates, key=lambda i: variances[i])
+        else:
+            dimension = self.split_dimension
+            l, u = self.ranges[dimension]
+            if not u > l + self.minimum_width:
+                return None
+
+        l, u = self.ranges[dimension]
+        midpoint = 0.5 * (l + u)
+        if self.split_policy == "midpoint":
+            return dimension, midpoint
+
+        values = np.array([point[dimension] for point in self.points])
+        median = float(np.median(values))
+        separates = l < median < u and np.any(values < median)
+        return dimension, median if separates else midpoint
 
     def _sort_by_child(self, points):
         """
@@ -88,8 +260,11 @@ class NTree:
         """
         () -> Float
         Return the point within the split dimension at which a division is placed
-        between the first and second child.
+        between the first and second child.  Until the bucket is split, this is
+        the midpoint of its range.
         """
+        if self._split_point is not None:
+            return self._split_point
         return 0.5 * sum(self.ranges[self.split_dimension])
 
     def within_bounds(self, point):
@@ -137,6 +312,9 @@ class NTree:
         """
         split_min, split_max = self.ranges[self.split_dimension]
         first_points, second_points = self._sort_by_child(self.points)
+        first_count, second_count = self._child_point_counts(
+            len(first_points), len(second_points)
+        )
         split_dimension = (
             self.split_dimension + 1
             if self.split_dimension + 1 < self.dimensions
@@ -144,7 +322,8 @@ class NTree:
         )
 
         self.has_children = True
-        self.first_child = NTree(
+        self.enclosing_tree._bucket_count += 1
+        self.first_child = type(self)(
             self._override_list_value(
                 self.ranges, self.split_dimension, (split_min, self.split_point)
             ),
@@ -153,8 +332,12 @@ class NTree:
             points=first_points,
             minimum_width=self.minimum_width,
             parent=self,
+            split_policy=self.split_policy,
+            reservoir_size=self.reservoir_size,
+            point_count=first_count,
+            maximum_buckets=self.maximum_buckets,
         )
-        self.second_child = NTree(
+        self.second_child = type(self)(
             self._override_list_value(
                 self.ranges, self.split_dimension, (self.split_point, split_max)
             ),
@@ -163,9 +346,27 @@ class NTree:
             points=second_points,
             minimum_width=self.minimum_width,
             parent=self,
+            split_policy=self.split_policy,
+            reservoir_size=self.reservoir_size,
+            point_count=second_count,
+            maximum_buckets=self.maximum_buckets,
         )
         self.points = None
 
+    def _child_point_counts(self, first_sampled, second_sampled):
+        """
+        Int -> Int -> (Int, Int)
+        Determine how many points each child will hold after a split, given
+        how many of the bucket's stored points fall into each.  If the bucket
+        only keeps a sample of its points, the counts are estimated by scaling
+        up the sample.
+        """
+        sampled = first_sampled + second_sampled
+        if self.reservoir_size is None or sampled == 0:
+            return first_sampled, second_sampled
+        first_count = int(round(self.point_count * first_sampled / sampled))
+        return first_count, self.point_count - first_count
+
     @staticmethod
     def _override_list_value(values, index, new_value):
         """
@@ -194,7 +395,8 @@ class NTree:
         """
         () -> [[Float]]
         Return a list of all points contained either within the n-tree
-        or its children.
+        or its children.  If the tree only counts its points, this is the
+        sample of them kept by each bucket.
         """
         return (
             self.points
@@ -206,9 +408,11 @@ class NTree:
     def point_count(self):
         """
         () -> Int
-        Return the number of points in the n-tree.
+        Return the number of points in the n-tree.  The count is maintained
+        incrementally as points are added, so no traversal of the children is
+        required.
         """
-        return len(self.all_points)
+        return self._point_count
 
     def __str__(self):
         """
@@ -293,10 +497,65 @@ class NTree:
         volume.  Can be interpreted as the density of the n-tree within this
         bucket relative to one which is filled uniformly.
         """
-        return (self.point_count / self.enclosing_tree.point_count) / (
-            2 ** (-self.depth)
+        enclosing_tree = self.enclosing_tree
+        return (self.point_count / enclosing_tree.point_count) / (
+            self.volume / enclosing_tree.volume
         )
 
+    def relative_density_at_points(self, points):
+        """
+        np.array -> np.array
+        Calculate the relative density within the top-level tree of each of a
+        batch of points.  Points outside the bounds of the tree are given a
+        relative density of zero.
+        """
+        enclosing_tree = self.enclosing_tree
+        densities = np.zeros(len(points))
+        for leaf, indices in self._leaves_containing(points):
+            densities[indices] = (leaf.point_count / enclosing_tree.point_count) / (
+                leaf.volume / enclosing_tree.volume
+            )
+        return densities
+
+    def probability_density_many(self, points):
+        """
+        np.array -> np.array
+        Calculate the probability density of the tree, interpreted as a probability
+        distribution, at each of a batch of points.
+        """
+        densities = np.zeros(len(points))
+        for leaf, indices in self._leaves_containing(points):
+            densities[indices] = leaf.point_count / (self.point_count * leaf.volume)
+        return densities
+
+    def _leaves_containing(self, points):
+        """
+        np.array -> [(NTree, np.array)]
+        Route a batch of points down the tree together, one level at a time,
+        returning each leaf reached along with the indices of the points that
+        fell into it.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, self.dimensions)
+        within_bounds = np.ones(points.shape[0], dtype=bool)
+        for i, (l, u) in enumerate(self.ranges):
+            within_bounds &= (l <= points[:, i]) & (points[:, i] < u)
+
+        leaves = []
+        level = [(self, np.flatnonzero(within_bounds))]
+        while len(level) > 0:
+            next_level = []
+            for bucket, indices in level:
+                if indices.size == 0:
+                    continue
+                elif not bucket.has_children:
+                    leaves.append((bucket, indices))
+                else:
+                    first = points[indices, bucket.split_dimension] < bucket.split_point
+                    next_level.append((bucket.first_child, indices[first]))
+                    next_level.append((bucket.second_child, indices[~first]))
+            level = next_level
+        return leaves
+
     def probability_density(self, point):
         """
         [Float] -> Float
@@ -316,21 +575,120 @@ class NTree:
                 # Calculated as the ratio of proportion of points to proportion
                 # of volume
                 number_of_points = self.point_count
+                volume = self.volume
                 return self.first_child._probability_density_inner(
                     point,
                     data_proportion * (self.first_child.point_count / number_of_points),
-                    0.5 * volume_proportion,
+                    volume_proportion * (self.first_child.volume / volume),
                 ) + self.second_child._probability_density_inner(
                     point,
                     data_proportion
                     * (self.second_child.point_count / number_of_points),
-                    0.5 * volume_proportion,
+                    volume_proportion * (self.second_child.volume / volume),
                 )
             else:
                 return data_proportion / volume_proportion
         else:
             return 0.0
 
+    def range_count(self, lower, upper):
+        """
+        np.array -> np.array -> np.array
+        Count the points within each of a batch of boxes, given as arrays of
+        their lower and upper corners.  The tree must keep all of its points.
+        """
+        return self._queryable_points().range_count(lower, upper)
+
+    def nearest_neighbours(self, points, k=1):
+        """
+        np.array -> Int? -> (np.array, np.array)
+        Find the k points in the n-tree nearest to each of a batch of points,
+        returning their distances and the neighbouring points themselves.  The
+        tree must keep all of its points.
+        """
+        frozen = self._queryable_points()
+        distances, indices = frozen.nearest_neighbours(points, k=k)
+        return distances, frozen.points[indices]
+
+    def sample(self, n, generator=None):
+        """
+        Int -> np.random.Generator? -> np.array
+        Draw n points from the piecewise-constant distribution represented by
+        the n-tree.
+        """
+        return self.frozen.sample(n, generator=generator)
+
+    @property
+    def frozen(self):
+        """
+        () -> FrozenNTree
+        Return a frozen copy of the n-tree, without its points, from which
+        samples are drawn.  The copy is kept until points are next added
+        through this bucket, so repeated queries do not rebuild it.
+        """
+        if self._frozen is None:
+            self._frozen = self.freeze()
+        return self._frozen
+
+    def _queryable_points(self):
+        """
+        () -> FrozenNTree
+        Return a frozen copy of the n-tree including its points, kept in the
+        same way as `frozen`, for queries over the points themselves.  A tree
+        which only counts its points cannot answer such queries exactly.
+        """
+        if self.reservoir_size is not None:
+            raise ValueError(
+                "n-trees which only count their points cannot answer range or "
+                + "nearest-neighbour queries"
+            )
+        if self._frozen_with_points is None:
+            self._frozen_with_points = self.freeze(store_points=True)
+        return self._frozen_with_points
+
+    def freeze(self, store_points=False):
+        """
+        Bool? -> FrozenNTree
+        Compile the n-tree into an immutable lookup structure whose leaf densities
+        are precomputed, treating this bucket as the root.  Later changes to this
+        tree are not reflected in it.  Optionally, the points held by each leaf
+        are copied into the frozen tree as well.
+        """
+        buckets = [self]
+        first_child = []
+        for bucket in buckets:
+            if bucket.has_children:
+                first_child.append(len(buckets))
+                buckets += [bucket.first_child, bucket.second_child]
+            else:
+                first_child.append(-1)
+
+        return FrozenNTree(
+            [[l for l, _ in bucket.ranges] for bucket in buckets],
+            [[u for _, u in bucket.ranges] for bucket in buckets],
+            [bucket.split_dimension for bucket in buckets],
+            [bucket.split_point for bucket in buckets],
+            first_child,
+            [bucket.point_count for bucket in buckets],
+            **(self._leaf_points(buckets) if store_points else {})
+        )
+
+    def _leaf_points(self, buckets):
+        """
+        [NTree] -> Dict
+        Gather the points held by the leaves among a list of buckets, along
+        with the position in the list of the leaf holding each point.
+        """
+        points, point_leaves = [], []
+        for i, bucket in enumerate(buckets):
+            if not bucket.has_children:
+                points += bucket.points
+                point_leaves += [i] * len(bucket.points)
+        return {
+            "points": np.array(points).reshape(-1, self.dimensions),
+            "point_leaves": point_leaves,
+        }
+
     def histogram(self, save_location=None):
         """
         String? -> ()
@@ -358,3 +716,37 @@ class NTree:
             raise Exception(
                 "histogram not defined for {} dimensions".format(self.dimensions)
             )
+
+
+def build_in_parallel(ranges, capacity, points, workers=None, minimum_width=0.001):
+    """
+    [(Float, Float)] -> Int -> [[Float]] -> Int? -> Float? -> NTree
+    Build an n-tree by populating trees from disjoint shards of the points in
+    separate processes, and then merging them.  By default, one process is
+    used per CPU.
+    """
+    workers = cpu_count() if workers is None else workers
+    shards = np.array_split(np.asarray(points), workers)
+    with ProcessPoolExecutor(workers) as executor:
+        trees = list(
+            executor.map(
+                _build_shard,
+                [(ranges, capacity, shard, minimum_width) for shard in shards],
+            )
+        )
+
+    tree = trees[0]
+    for other in trees[1:]:
+        tree.merge(other)
+    return tree
+
+
+def _build_shard(args):
+    """
+    ([(Float, Float)], Int, np.array, Float) -> NTree
+    Build an n-tree from a single shard of points.
+    """
+    ranges, capacity, points, minimum_width = args
+    tree = NTree(ranges, capacity, minimum_width=minimum_width)
+    tree.add_points(list(points))
+    return tree
@@ -0,0 +1,214 @@
+import numpy as np
+import tensorflow as tf
+
+
+def random_walk_kernel(log_density, step_size=1.0):
+    """
+    (tf.Node -> tf.Node) -> Either Float tf.Node
+        -> ((tf.Node -> (tf.Node, tf.Node)), ((tf.Node, tf.Node) -> (tf.Node, tf.Node)))
+    Create a random-walk Metropolis-Hastings transition kernel for a batch of
+    chains within a tensorflow graph.  The log density function should map a
+    node of points, one row per chain, to their log densities.  Returns a
+    function creating the kernel's initial state from a node of starting points,
+    and a function advancing the state by one step.  The state is a tuple of
+    the current points and their log densities.
+    """
+
+    def initial_state(x):
+        return (x, log_density(x))
+
+    def step(state):
+        x, log_p = state
+        proposal = x + tf.cast(step_size, x.dtype) * tf.random.normal(
+            tf.shape(x), dtype=x.dtype
+        )
+        proposal_log_p = log_density(proposal)
+        accepted = _accept_in_graph(log_p, proposal_log_p - log_p)
+        return (
+            tf.where(accepted, proposal, x),
+            tf.where(accepted, proposal_log_p, log_p),
+        )
+
+    return initial_state, step
+
+
+def langevin_kernel(log_density, step_size=0.1):
+    """
+    (tf.Node -> tf.Node) -> Either Float tf.Node
+        -> ((tf.Node -> (tf.Node...)), ((tf.Node...) -> (tf.Node...)))
+    Create a Metropolis-adjusted Langevin transition kernel for a batch of
+    chains within a tensorflow graph.  Proposals drift along the gradient of the
+    log density, which is taken from the graph.  The state is a tuple of the
+    current points, their log densities and the gradients of their log densities.
+    """
+    value_and_gradient = _value_and_gradient(log_density)
+
+    def initial_state(x):
+        return (x,) + value_and_gradient(x)
+
+    def step(state):
+        x, log_p, gradient = state
+        epsilon = tf.cast(step_size, x.dtype)
+        proposal = (
+            x
+            + 0.5 * tf.square(epsilon) * gradient
+            + epsilon * tf.random.normal(tf.shape(x), dtype=x.dtype)
+        )
+        proposal_log_p, proposal_gradient = value_and_gradient(proposal)
+
+        def log_transition(source, source_gradient, target):
+            return -tf.reduce_sum(
+                tf.square(target - source - 0.5 * tf.square(epsilon) * source_gradient),
+                axis=1,
+            ) / (2 * tf.square(epsilon))
+
+        accepted = _accept_in_graph(
+            log_p,
+            proposal_log_p
+            - log_p
+            + log_transition(proposal, proposal_gradient, x)
+            - log_transition(x, gradient, proposal),
+        )
+        return (
+            tf.where(accepted, proposal, x),
+            tf.where(accepted, proposal_log_p, log_p),
+            tf.where(accepted, proposal_gradient, gradient),
+        )
+
+    return initial_state, step
+
+
+def hamiltonian_kernel(log_density, step_size=0.1, leapfrog_steps=10):
+    """
+    (tf.Node -> tf.Node) -> Either Float tf.Node -> Either Int tf.Node
+        -> ((tf.Node -> (tf.Node...)), ((tf.Node...) -> (tf.Node...)))
+    Create a Hamiltonian Monte Carlo transition kernel for a batch of chains
+    within a tensorflow graph.  Each step draws a momentum for every chain and
+    follows the trajectory with a number of leapfrog steps, using gradients of
+    the log density taken from the graph.  The state is a tuple of the current
+    points, their log densities and the gradients of their log densities.
+    """
+    value_and_gradient = _value_and_gradient(log_density)
+
+    def initial_state(x):
+        return (x,) + value_and_gradient(x)
+
+    def step(state):
+        x, log_p, gradient = state
+        momentum = tf.random.normal(tf.shape(x), dtype=x.dtype)
+        proposal, proposal_momentum, proposal_log_p, proposal_gradient = leapfrog(
+            value_and_gradient,
+            x,
+            momentum,
+            log_p,
+            gradient,
+            tf.cast(step_size, x.dtype),
+            leapfrog_steps,
+        )
+        accepted = _accept_in_graph(
+            log_p,
+            proposal_log_p
+            - log_p
+            + 0.5 * tf.reduce_sum(tf.square(momentum), axis=1)
+            - 0.5 * tf.reduce_sum(tf.square(proposal_momentum), axis=1),
+        )
+        return (
+            tf.where(accepted, proposal, x),
+            tf.where(accepted, proposal_log_p, log_p),
+            tf.where(accepted, proposal_gradient, gradient),
+        )
+
+    return initial_state, step
+
+
+def leapfrog(value_and_gradient, x, momentum, log_p, gradient, step_size, steps):
+    """
+    (tf.Node -> (tf.Node, tf.Node)) -> tf.Node -> tf.Node -> tf.Node -> tf.Node
+        -> Either Float tf.Node -> Either Int tf.Node
+        -> (tf.Node, tf.Node, tf.Node, tf.Node)
+    Integrate Hamiltonian dynamics for a batch of chains with the leapfrog
+    scheme, where the potential energy is the negative log density.  Returns the
+    final points, momenta, log densities and gradients of the log densities.
+    """
+    momentum = momentum + 0.5 * step_size * gradient
+
+    def body(i, x, momentum, log_p, gradient):
+        x = x + step_size * momentum
+        log_p, gradient = value_and_gradient(x)
+        momentum = momentum + step_size * gradient
+        return i + 1, x, momentum, log_p, gradient
+
+    _, x, momentum, log_p, gradient = tf.while_loop(
+        lambda i, *_: i < steps,
+        body,
+        (tf.constant(0), x, momentum, log_p, gradient),
+        back_prop=False,
+    )
+    return x, momentum - 0.5 * step_size * gradient, log_p, gradient
+
+
+def _value_and_gradient(log_density):
+    """
+    (tf.Node -> tf.Node) -> (tf.Node -> (tf.Node, tf.Node))
+    Wrap a log density function so that it also returns the gradient of each
+    chain's log density with respect to its point.  Gradients which are not
+    finite, such as those outside the support of the density, are set to zero.
+    """
+
+    def value_and_gradient(x):
+        log_p = log_density(x)
+        gradient = tf.gradients(log_p, x)[0]
+        return (
+            log_p,
+            tf.where(tf.is_finite(gradient), gradient, tf.zeros_like(gradient)),
+        )
+
+    return value_and_gradient
+
+
+def _accept_in_graph(log_p, log_acceptance_ratio):
+    """
+    tf.Node -> tf.Node -> tf.Node
+    Decide which proposals to accept given the log density of each chain's
+    current point and the log of each acceptance ratio.  Chains whose current
+    point has zero density accept any proposal.
+    """
+    log_u = tf.log(1 - tf.random.uniform(tf.shape(log_p), dtype=log_p.dtype))
+    return tf.logical_or(
+        tf.equal(log_p, -np.inf), tf.less_equal(log_u, log_acceptance_ratio)
+    )
+
+
+def tensorflow_chain(kernel, start, burn_in, samples, gap):
+    """
+    ((tf.Node -> (tf.Node...)), ((tf.Node...) -> (tf.Node...))) -> tf.Node
+        -> Either Int tf.Node -> Either Int tf.Node -> Either Int tf.Node -> tf.Node
+    Build a tensorflow graph which advances a batch of chains, one per row of
+    the starting node, through a burn-in and then takes a number of samples
+    from each chain with a gap between them.  The whole schedule is a loop
+    within the graph, so it is run by a single call to the session.  Returns a
+    node of shape (samples, chains, dimensions).
+    """
+    initial_state, step = kernel
+
+    def advance(state, iterations):
+        _, state = tf.while_loop(
+            lambda i, _: i < iterations,
+            lambda i, state: (i + 1, step(state)),
+            (tf.constant(0), state),
+            back_prop=False,
+        )
+        return state
+
+    def take_sample(i, state, output):
+        state = advance(state, gap)
+        return i + 1, state, output.write(i, state[0])
+
+    state = advance(initial_state(start), burn_in)
+    _, _, output = tf.while_loop(
+        lambda i, *_: i < samples,
+        take_sample,
+        (tf.constant(0), state, tf.TensorArray(start.dtype, size=samples)),
+        back_prop=False,
+    )
+    return output.stack()
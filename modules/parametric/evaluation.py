@@ -1,5 +1,15 @@
-from maths.ntree import NTree
-from maths.mcmc import mcmc_samples
+from maths.ntree import NTree, build_in_parallel
+from maths.mcmc import (
+    adaptive_batched_mcmc_samples,
+    AdaptiveGaussianProposal,
+    defensive_mixture,
+    independence_batched_mcmc_samples,
+    parallel_tempering_samples,
+    mcmc_samples_until_converged,
+)
+from maths.divergence import two_sample_divergences
+from os import makedirs
+from os.path import join
 import numpy as np
 
 
@@ -13,12 +23,20 @@ class EvaluationParameters:
         monte_carlo_sample_gap,
         n_tree_bucket_size,
         n_tree_population,
+        n_tree_workers=1,
+        monte_carlo_method="random_walk",
+        monte_carlo_step_size=1.0,
+        monte_carlo_target_ess=None,
+        n_tree_save_folder=None,
     ):
         """
-        Either String [np.array] -> Int -> Int -> Int -> Int -> Int -> Int
-            -> EvaluationParameters
+        Either String [np.array] -> Int -> Int -> Int -> Int -> Int -> Int -> Int?
+            -> String? -> Float? -> Float? -> String? -> EvaluationParameters
         Data class for storing parameters related to the evaluation JSON
-        that should be produced after the experiment has run.
+        that should be produced after the experiment has run.  If a folder is
+        given for n-trees, the frozen n-tree fitted to the generator's solutions
+        to each constraint is saved there, so that it can be reopened later
+        without sampling the generator again; each run should use its own folder.
         """
         self.constraint_samples = constraint_samples
         self.generated_solutions_per_constraint = generated_solutions_per_constraint
@@ -26,27 +44,43 @@ class EvaluationParameters:
 
         self.monte_carlo_burn_in = monte_carlo_burn_in
         self.monte_carlo_sample_gap = monte_carlo_sample_gap
+        self.monte_carlo_method = monte_carlo_method
+        self.monte_carlo_step_size = monte_carlo_step_size
+        self.monte_carlo_target_ess = monte_carlo_target_ess
 
         self.n_tree_bucket_size = n_tree_bucket_size
         self.n_tree_population = n_tree_population
+        self.n_tree_workers = n_tree_workers
+        self.n_tree_save_folder = n_tree_save_folder
 
     def to_json(self):
         """
         () -> Dict
         Return a representation of a set of evaluation parameters as a JSON-like object.
         """
+        monte_carlo = {
+            "burnIn": self.monte_carlo_burn_in,
+            "sampleGap": self.monte_carlo_sample_gap,
+            "method": self.monte_carlo_method,
+            "stepSize": self.monte_carlo_step_size,
+        }
+        if self.monte_carlo_target_ess is not None:
+            monte_carlo["targetEffectiveSampleSize"] = self.monte_carlo_target_ess
+
+        n_tree = {
+            "bucketSize": self.n_tree_bucket_size,
+            "population": self.n_tree_population,
+            "workers": self.n_tree_workers,
+        }
+        if self.n_tree_save_folder is not None:
+            n_tree["saveFolder"] = self.n_tree_save_folder
+
         return {
             "constraintSamples": self.constraint_samples,
             "generatedSolutionsPerConstraint": self.generated_solutions_per_constraint,
             "trueSolutionsPerConstraint": self.true_solutions_per_constraint,
-            "monteCarlo": {
-                "burnIn": self.monte_carlo_burn_in,
-                "sampleGap": self.monte_carlo_sample_gap,
-            },
-            "nTree": {
-                "bucketSize": self.n_tree_bucket_size,
-                "population": self.n_tree_population,
-            },
+            "monteCarlo": monte_carlo,
+            "nTree": n_tree,
         }
 
     @staticmethod
@@ -63,6 +97,11 @@ class EvaluationParameters:
             json["monteCarlo"]["sampleGap"],
             json["nTree"]["bucketSize"],
             json["nTree"]["population"],
+            n_tree_workers=json["nTree"].get("workers", 1),
+            monte_carlo_method=json["monteCarlo"].get("method", "random_walk"),
+            monte_carlo_step_size=json["monteCarlo"].get("stepSize", 1.0),
+            monte_carlo_target_ess=json["monteCarlo"].get("targetEffectiveSampleSize"),
+            n_tree_save_folder=json["nTree"].get("saveFolder"),
         )
 
     def evaluate(self, trainer):
@@ -83,7 +122,7 @@ class EvaluationParameters:
         if trainer.log:
             i = 0
             print()
-        for constraint in data["constraintSamples"]:
+        for index, constraint in enumerate(data["constraintSamples"]):
             if trainer.log:
                 i += 1
                 print(
@@ -94,10 +133,15 @@ class EvaluationParameters:
 
             self.append_generated_solutions(constraint, export)
             self.append_true_solutions(constraint, export, trainer)
-            self.calculate_solution_properties(constraint, export, trainer)
+            self.calculate_solution_properties(
+                constraint, export, trainer, n_tree_path=self._n_tree_path(index)
+            )
             constraint["summary"] = self.calculate_solution_statistics(constraint)
 
         data["summary"] = self.calculate_solution_statistics(data["constraintSamples"])
+        data["divergenceSummary"] = self.summarise_divergences(
+            data["constraintSamples"]
+        )
 
         if trainer.log:
             print("Done.")
@@ -127,38 +171,162 @@ class EvaluationParameters:
         """
         Dict -> ExportedParametricGenerator -> Trainer -> ()
         Append `true_solutions_per_constraint` solutions, taken from the true target
-        distribution using a Markov chain, to the list of solutions for each constraint.
-        """
-        f = export.satisfaction_probability(constraint["constraint"])
-        solutions = mcmc_samples(
-            f,
-            self.true_solutions_per_constraint,
-            self.monte_carlo_sample_gap,
-            self.monte_carlo_burn_in,
-            [0.5] * trainer.parametric_generator.solution_dimension,
-        )[1:]
+        distribution using Markov chains, to the list of solutions for each constraint.
+        One chain is run per solution, and all chains are advanced together within
+        the tensorflow graph, unless the adaptive method is used, in which case the
+        proposal distribution is tuned to the target during burn-in.  The
+        independence method instead proposes solutions from an n-tree fitted to
+        samples from the generator, whose density is known exactly, mixed with a
+        uniform distribution over the solution space so that regions which the
+        generator misses can still be reached.  The tempering method runs a
+        ladder of tempered replicas for each chain, which lets the chains move
+        between disconnected regions of the solution space.
+
+        If a target effective sample size is set, the in-graph chains are instead
+        run without a fixed burn-in until they appear to have converged, for no
+        more than `monte_carlo_burn_in` iterations, and their diagnostics are
+        recorded against the constraint.
+        """
+        solution_dimension = trainer.parametric_generator.solution_dimension
+        starts = np.full([self.true_solutions_per_constraint, solution_dimension], 0.5)
+
+        if self.monte_carlo_target_ess is not None:
+            if self.monte_carlo_method in ["adaptive", "independence", "tempering"]:
+                raise ValueError(
+                    "a target effective sample size cannot be used with the "
+                    + "'{}' method".format(self.monte_carlo_method)
+                )
+            samples, constraint["monteCarloDiagnostics"] = mcmc_samples_until_converged(
+                lambda xs, n: export.mcmc_for_constraint(
+                    constraint["constraint"],
+                    xs,
+                    0,
+                    n,
+                    self.monte_carlo_sample_gap,
+                    step_size=self.monte_carlo_step_size,
+                    method=self.monte_carlo_method,
+                ),
+                starts,
+                self.monte_carlo_target_ess,
+                max(self.monte_carlo_burn_in // self.monte_carlo_sample_gap, 4),
+            )
+            solutions = samples[-1]
+        elif self.monte_carlo_method == "adaptive":
+            solutions = adaptive_batched_mcmc_samples(
+                export.satisfaction_probabilities(constraint["constraint"]),
+                1,
+                self.monte_carlo_sample_gap,
+                self.monte_carlo_burn_in,
+                starts,
+                proposal=AdaptiveGaussianProposal(
+                    solution_dimension, initial_scale=self.monte_carlo_step_size
+                ),
+            )[1]
+        elif self.monte_carlo_method == "independence":
+            ntree = self._make_n_tree(
+                self._sample_population(export, constraint["constraint"]), trainer
+            )
+            propose, proposal_density = defensive_mixture(
+                ntree.sample,
+                ntree.probability_density_many,
+                self._solution_ranges(trainer),
+            )
+            solutions = independence_batched_mcmc_samples(
+                export.satisfaction_probabilities(constraint["constraint"]),
+                propose,
+                proposal_density,
+                1,
+                self.monte_carlo_sample_gap,
+                self.monte_carlo_burn_in,
+                propose(self.true_solutions_per_constraint),
+            )[1]
+        elif self.monte_carlo_method == "tempering":
+            solutions = parallel_tempering_samples(
+                export.satisfaction_probabilities(constraint["constraint"]),
+                1,
+                self.monte_carlo_sample_gap,
+                self.monte_carlo_burn_in,
+                starts,
+                step_size=self.monte_carlo_step_size,
+            )[1]
+        else:
+            solutions = export.mcmc_for_constraint(
+                constraint["constraint"],
+                starts,
+                self.monte_carlo_burn_in,
+                1,
+                self.monte_carlo_sample_gap,
+                step_size=self.monte_carlo_step_size,
+                method=self.monte_carlo_method,
+            )[0]
         for solution in solutions:
             constraint["solutions"].append({"solution": solution, "type": "true"})
 
-    def calculate_solution_properties(self, constraint, export, trainer):
+    def calculate_solution_properties(
+        self, constraint, export, trainer, n_tree_path=None
+    ):
         """
-        Dict -> ExportedParametricGenerator -> Trainer -> ()
+        Dict -> ExportedParametricGenerator -> Trainer -> String? -> ()
         Calculate satisfaction probability and relative density in the latent
-        space of each solution to a constraint.
+        space of each solution to a constraint, as well as divergences between
+        the generated and true distributions of solutions.  If a path is given,
+        the n-tree used to calculate relative densities is saved there, and the
+        path recorded against the constraint.
         """
         satisfaction_probability = export.satisfaction_probability(
             constraint["constraint"]
         )
 
-        ntree = self._make_n_tree(export, constraint["constraint"], trainer)
-        for solution in constraint["solutions"]:
-            solution["relativeDensity"] = ntree.relative_density_at_point(
-                solution["solution"], error_if_out_of_bounds=False
-            )
+        population = self._sample_population(export, constraint["constraint"])
+        constraint["divergence"] = self.calculate_divergences(
+            constraint, population, trainer
+        )
+
+        ntree = self._make_n_tree(population, trainer)
+        if n_tree_path is not None:
+            ntree.save(n_tree_path)
+            constraint["nTreePath"] = n_tree_path
+
+        relative_densities = ntree.relative_density_at_points(
+            np.array([solution["solution"] for solution in constraint["solutions"]])
+        )
+        for solution, relative_density in zip(
+            constraint["solutions"], relative_densities
+        ):
+            solution["relativeDensity"] = relative_density
             solution["satisfactionProbability"] = satisfaction_probability(
                 solution["solution"]
             )
 
+    def calculate_divergences(self, constraint, population, trainer):
+        """
+        Dict -> [np.array] -> Trainer -> Dict
+        Estimate the KL divergence, total variation, recall, and precision of a
+        population of generated solutions with respect to the true solutions to
+        a constraint, using an n-tree shared between the two.
+        """
+        return two_sample_divergences(
+            self._solution_ranges(trainer),
+            self.n_tree_bucket_size,
+            [
+                solution["solution"]
+                for solution in self.solutions_of_type(constraint, "true")
+            ],
+            population,
+        )
+
+    def summarise_divergences(self, constraints):
+        """
+        [Dict] -> Dict
+        Summarise each divergence measure over a list of constraints.
+        """
+        return {
+            name: self.summarise_values(
+                [constraint["divergence"][name] for constraint in constraints], ""
+            )
+            for name in constraints[0]["divergence"]
+        }
+
     def calculate_solution_statistics(self, constraint):
         """
         Either [Dict] Dict -> Dict
@@ -220,26 +388,56 @@ class EvaluationParameters:
             "median" + name: _median(values),
         }
 
-    def _make_n_tree(self, export, constraint, trainer):
+    def _sample_population(self, export, constraint):
         """
-        ExportedParametricGenerator -> np.array -> Trainer -> NTree
-        Build a suitably sized n-tree and populate it with samples from the
-        generator.
+        ExportedParametricGenerator -> np.array -> [np.array]
+        Sample a population of solutions to a constraint from the generator.
         """
-        ntree = NTree(
-            [
-                (
-                    trainer.parametric_generator.solution_lower_bound,
-                    trainer.parametric_generator.solution_upper_bound,
-                )
-            ]
-            * trainer.parametric_generator.solution_dimension,
-            self.n_tree_bucket_size,
-        )
-
         samples = export.sample_for_constraint(constraint, self.n_tree_population)
-        ntree.add_points([sample.solution for sample in samples])
-        return ntree
+        return [sample.solution for sample in samples]
+
+    def _solution_ranges(self, trainer):
+        """
+        Trainer -> [(Float, Float)]
+        Return the bounds of the solution space in each dimension.
+        """
+        return [
+            (
+                trainer.parametric_generator.solution_lower_bound,
+                trainer.parametric_generator.solution_upper_bound,
+            )
+        ] * trainer.parametric_generator.solution_dimension
+
+    def _n_tree_path(self, index):
+        """
+        Int -> String?
+        Return the path to which the n-tree of the constraint at the given
+        index should be saved, creating its folder if necessary, or None if
+        n-trees are not being saved.
+        """
+        if self.n_tree_save_folder is None:
+            return None
+        makedirs(self.n_tree_save_folder, exist_ok=True)
+        return join(self.n_tree_save_folder, "constraint{}.ntree".format(index))
+
+    def _make_n_tree(self, solutions, trainer):
+        """
+        [np.array] -> Trainer -> FrozenNTree
+        Build a suitably sized n-tree and populate it with a population of
+        solutions sampled from the generator.  The tree is frozen once populated,
+        since it is only queried from then on.  If more than one worker is
+        requested, the tree is built from shards of the samples in parallel.
+        """
+        ranges = self._solution_ranges(trainer)
+
+        if self.n_tree_workers > 1:
+            ntree = build_in_parallel(
+                ranges, self.n_tree_bucket_size, solutions, workers=self.n_tree_workers
+            )
+        else:
+            ntree = NTree(ranges, self.n_tree_bucket_size)
+            ntree.add_points(solutions)
+        return ntree.freeze()
 
     def _make_constraint_samples(self, trainer):
         """
@@ -1,3 +1,9 @@
+from maths.tfmcmc import (
+    random_walk_kernel,
+    langevin_kernel,
+    hamiltonian_kernel,
+    tensorflow_chain,
+)
 import modules.reusablenet as rnet
 import tensorflow as tf
 import numpy as np
@@ -19,6 +25,10 @@ class ExportedParametricGenerator:
         self.satisfaction_probability = self._make_satisfaction_probability(
             generator, session
         )
+        self.satisfaction_probabilities = self._make_satisfaction_probabilities(
+            generator, session
+        )
+        self.mcmc_for_constraint = self._make_mcmc_for_constraint(generator, session)
 
     def _make_sample_for_constraint(self, parametric_generator, session):
         """
@@ -98,27 +108,32 @@ class ExportedParametricGenerator:
             """
             np.array -> (np.array -> np.array)
             Given a constraint, return a function that maps a list of latent
-            coordinates into the solution space.
+            coordinates into the solution space.  The latent coordinates may be
+            arranged in an array of any shape whose last axis indexes the latent
+            dimensions, such as a batch of contours, in which case every point is
+            mapped in a single call and the output has the same arrangement.
             """
             np_constraint = np.array(constraint)
 
             def map_to_solution_inner(latent_points):
-                wrapped = False
-
                 np_latent_points = np.array(latent_points)
-                if len(np_latent_points.shape) == 1:
-                    np_latent_points = np.array([np_latent_points])
-                    wrapped = True
 
                 output = session.run(
                     generator["output"],
                     feed_dict={
                         constraint_placeholder: np_constraint,
-                        latent_placeholder: np_latent_points,
+                        latent_placeholder: np.reshape(
+                            np_latent_points,
+                            [-1, parametric_generator.latent_dimension],
+                        ),
                     },
                 )
 
-                return output if not wrapped else output[0]
+                return np.reshape(
+                    output,
+                    np_latent_points.shape[:-1]
+                    + (parametric_generator.solution_dimension,),
+                )
 
             return map_to_solution_inner
 
@@ -203,6 +218,143 @@ class ExportedParametricGenerator:
 
         return satisfaction_probability_function
 
+    def _make_satisfaction_probabilities(self, generator, session):
+        """
+        ParametricGenerator -> tf.Session -> (np.array -> (np.array -> np.array))
+        Return a curried function that takes the constraint vector and then a
+        batch of solution vectors, and returns the estimated probability of each
+        solution satisfying the constraint in a single evaluation.
+        """
+        discriminator = generator.build_discriminator(
+            generator.solution_input, generator.constraint_input
+        )
+
+        def satisfaction_probabilities_function(constraint):
+            """
+            np.array -> (np.array -> np.array)
+            Return a function that calculates the probability of each of a batch
+            of solution vectors satisfying the given constraint.  Solutions outside
+            the solution space have a probability of zero.
+            """
+            l, u = generator.solution_lower_bound, generator.solution_upper_bound
+
+            def satisfaction_probabilities(solutions):
+                _solutions = np.reshape(solutions, [-1, generator.solution_dimension])
+                within_bounds = np.all((l <= _solutions) & (_solutions < u), axis=1)
+                probabilities = np.zeros(_solutions.shape[0])
+                if np.any(within_bounds):
+                    probabilities[within_bounds] = np.reshape(
+                        session.run(
+                            discriminator["output"],
+                            feed_dict={
+                                generator.constraint_input: np.tile(
+                                    constraint, [np.sum(within_bounds), 1]
+                                ),
+                                generator.solution_input: _solutions[within_bounds],
+                            },
+                        ),
+                        [-1],
+                    )
+                return probabilities
+
+            return satisfaction_probabilities
+
+        return satisfaction_probabilities_function
+
+    def _make_mcmc_for_constraint(self, generator, session):
+        """
+        ParametricGenerator -> tf.Session
+            -> (np.array -> np.array -> Int -> Int -> Int -> Float? -> String?
+                -> Int? -> np.array)
+        Return a function that samples solutions to a constraint by running a
+        batch of Markov chains whose target density is the discriminator's
+        satisfaction probability.  The chains run entirely within the graph, so
+        the burn-in and every sample are computed by a single call to the session.
+        Chains may take random-walk, Langevin or Hamiltonian steps; the latter two
+        follow the gradient of the discriminator.
+        """
+        constraint_input = rnet.make_input_node([generator.constraint_dimension])
+        start_input = rnet.make_input_node([None, generator.solution_dimension])
+        burn_in_input = tf.placeholder(tf.int32, shape=[])
+        samples_input = tf.placeholder(tf.int32, shape=[])
+        gap_input = tf.placeholder(tf.int32, shape=[])
+        step_size_input = tf.placeholder(tf.float32, shape=[])
+        leapfrog_steps_input = tf.placeholder_with_default(10, shape=[])
+
+        def log_density(solutions):
+            chains = tf.shape(solutions)[0]
+            probabilities = tf.reshape(
+                generator.build_discriminator(
+                    solutions, tf.tile(tf.expand_dims(constraint_input, 0), [chains, 1])
+                )["output"],
+                [-1],
+            )
+            within_bounds = tf.reduce_all(
+                tf.logical_and(
+                    solutions >= generator.solution_lower_bound,
+                    solutions < generator.solution_upper_bound,
+                ),
+                axis=1,
+            )
+            return tf.where(
+                within_bounds,
+                tf.log(probabilities),
+                tf.fill([chains], -np.inf),
+            )
+
+        kernels = {
+            "random_walk": lambda: random_walk_kernel(log_density, step_size_input),
+            "langevin": lambda: langevin_kernel(log_density, step_size_input),
+            "hamiltonian": lambda: hamiltonian_kernel(
+                log_density, step_size_input, leapfrog_steps_input
+            ),
+        }
+        samples_outputs = {}
+
+        def mcmc_for_constraint(
+            constraint,
+            starts,
+            burn_in,
+            samples,
+            gap,
+            step_size=1.0,
+            method="random_walk",
+            leapfrog_steps=10,
+        ):
+            """
+            np.array -> np.array -> Int -> Int -> Int -> Float? -> String? -> Int?
+                -> np.array
+            Run one chain from each of the starting solutions, discarding the
+            first `burn_in` iterations and then taking `samples` samples from each
+            chain, `gap` iterations apart.  Returns an array of shape
+            (samples, chains, solution dimension).
+            """
+            if method not in kernels:
+                raise ValueError("unknown MCMC method '{}'".format(method))
+            if method not in samples_outputs:
+                samples_outputs[method] = tensorflow_chain(
+                    kernels[method](),
+                    start_input,
+                    burn_in_input,
+                    samples_input,
+                    gap_input,
+                )
+
+            return session.run(
+                samples_outputs[method],
+                feed_dict={
+                    constraint_input: constraint,
+                    start_input: starts,
+                    burn_in_input: burn_in,
+                    samples_input: samples,
+                    gap_input: gap,
+                    step_size_input: step_size,
+                    leapfrog_steps_input: leapfrog_steps,
+                },
+            )
+
+        return mcmc_for_constraint
+
     class GeneratorSample:
         def __init__(self, latent, solution, satisfaction_probability):
             """
@@ -4,15 +4,18 @@ import production.plots.extraction as ex
 import matplotlib.pyplot as plt
 
 
-def plot_satisfaction_vs_density(constraints, thinning_factor=8):
+def plot_satisfaction_vs_density(constraints, thinning_factor=8, show=True, latex=True):
     """
-    [Dict] -> Int? -> ()
+    [Dict] -> Int? -> Bool? -> Bool? -> ()
     Plot the lower quartile, median, and upper quartile of the satisfaction
     probabilities of generated solutions on the y-axis, and of the relative
-    densities of true solutions on the x-axis.
+    densities of true solutions on the x-axis.  Optionally, leave the plot
+    open rather than showing it, so that it can be saved instead, and disable
+    LaTeX for machines without it.
     """
-    rc("font", **{"family": "serif", "serif": ["Computer Modern"]})
-    rc("text", usetex=True)
+    if latex:
+        rc("font", **{"family": "serif", "serif": ["Computer Modern"]})
+        rc("text", usetex=True)
 
     for constraint in constraints[::8]:
         satisfaction_probabilities, relative_densities = ex.get_constraint_statistics(
@@ -39,7 +42,8 @@ def plot_satisfaction_vs_density(constraints, thinning_factor=8):
     plt.ylabel("Satisfaction probability of generated solutions")
     plt.xlim(0)
     plt.ylim(0)
-    plt.show()
+    if show:
+        plt.show()
 
 
 def training_progression_table(experiments):
@@ -1,3 +1,4 @@
+from maths.frozenntree import FrozenNTree
 from math import floor
 
 
@@ -30,6 +31,18 @@ def get_constraint_statistics(constraint):
     )
 
 
+def get_constraint_n_tree(constraint):
+    """
+    Dict -> FrozenNTree
+    Reopen the n-tree fitted to the generator's solutions to a logged constraint,
+    which is only saved if the evaluation was given a folder for n-trees.  The
+    tree is memory-mapped, so no samples need to be drawn from the generator.
+    """
+    if "nTreePath" not in constraint:
+        raise ValueError("no n-tree was saved for this constraint")
+    return FrozenNTree.load(constraint["nTreePath"])
+
+
 def get_experiment_constraint_samples(experiment):
     """
     Dict -> [Dict]
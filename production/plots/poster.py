@@ -5,13 +5,16 @@ import matplotlib.pyplot as plt
 import numpy as np
 
 
-def plot_branin_function(n=200, lower=0.0, upper=1.0):
+def plot_branin_function(n=200, lower=0.0, upper=1.0, show=True, latex=True):
     """
-    Int? -> Float? -> Float? -> ()
-    Plot the Branin function.
+    Int? -> Float? -> Float? -> Bool? -> Bool? -> ()
+    Plot the Branin function.  Optionally, leave the plot open rather than
+    showing it, so that it can be saved instead, and disable LaTeX for
+    machines without it.
     """
-    rc("font", **{"family": "serif", "serif": ["Computer Modern"]})
-    rc("text", usetex=True)
+    if latex:
+        rc("font", **{"family": "serif", "serif": ["Computer Modern"]})
+        rc("text", usetex=True)
 
     figure = plt.figure()
     axes = figure.gca(projection="3d")
@@ -33,4 +36,5 @@ def plot_branin_function(n=200, lower=0.0, upper=1.0):
     axes.set_ylim(0, 1)
     axes.set_zlim(0, 1)
 
-    plt.show()
+    if show:
+        plt.show()
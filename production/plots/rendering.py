@@ -0,0 +1,148 @@
+from concurrent.futures import ProcessPoolExecutor
+from os import cpu_count, makedirs
+from os.path import dirname
+from matplotlib import rc, rcParams
+from maths.mesh import Mesh
+import production.plots.spaces as spaces
+import production.plots.common as common
+import production.plots.poster as poster
+import matplotlib.pyplot as plt
+
+
+class FigureSpecification:
+    def __init__(self, kind, path, export=None, constraint=None, options=None):
+        """
+        String -> String -> ExportedParametricGenerator? -> [Float]? -> Dict?
+            -> FigureSpecification
+        Data class describing a figure to be rendered to a file by
+        `render_figures`.  The kind of figure must be one of `figure_kinds`;
+        figures of the solution or latent space require an export and a
+        constraint.  Options are passed as keyword arguments to the function
+        which evaluates the data for the figure, or which plots it for figures
+        that do not depend on a model.
+        """
+        if kind not in figure_kinds:
+            raise ValueError("unknown figure kind '{}'".format(kind))
+
+        self.kind = kind
+        self.path = path
+        self.export = export
+        self.constraint = constraint
+        self.options = {} if options is None else options
+
+
+def render_figures(specifications, workers=None, latex=True, dpi=None):
+    """
+    [FigureSpecification] -> Int? -> Bool? -> Int? -> [String]
+    Render each of the specified figures to its file without displaying it.
+    Everything each figure needs from its model is first evaluated in this
+    process, sharing a cache so that evaluations over the same mesh are made
+    only once for all the figures of an export and constraint.  The figures are
+    then drawn with the Agg backend in separate processes, by default one per
+    CPU.  Optionally, LaTeX may be disabled for machines without it.  Returns
+    the paths of the rendered figures.
+    """
+    cache = {}
+    jobs = [
+        (
+            specification.kind,
+            specification.path,
+            figure_kinds[specification.kind][0](specification, cache),
+            latex,
+            dpi,
+        )
+        for specification in specifications
+    ]
+
+    workers = cpu_count() if workers is None else workers
+    if workers > 1:
+        with ProcessPoolExecutor(
+            workers, initializer=_use_headless_backend
+        ) as executor:
+            return list(executor.map(_render, jobs))
+
+    _use_headless_backend()
+    return [_render(job) for job in jobs]
+
+
+def _render(job):
+    """
+    (String, String, Dict, Bool, Int?) -> String
+    Draw a single figure from its evaluated data and save it to its file.
+    """
+    kind, path, data, latex, dpi = job
+    if dirname(path) != "":
+        makedirs(dirname(path), exist_ok=True)
+
+    plt.figure()
+    if latex:
+        spaces.set_latex_font()
+    else:
+        rc("text", usetex=False)
+    figure_kinds[kind][1](data)
+    plt.savefig(path, dpi=dpi)
+    plt.close("all")
+    return path
+
+
+def _use_headless_backend():
+    """
+    () -> ()
+    Switch matplotlib to a backend which renders to files without a display.
+    """
+    plt.switch_backend("Agg")
+
+
+def _options(specification):
+    """
+    FigureSpecification -> Dict
+    Return the options of a figure of the latent space, which require a mesh,
+    using the unit square if none is given.
+    """
+    return {"mesh": Mesh.unit, **specification.options}
+
+
+# each kind of figure maps to a function evaluating its data, which may use the
+# shared cache, and a function drawing the figure from that data; figures which
+# would otherwise enable LaTeX themselves keep the setting chosen by `_render`
+figure_kinds = {
+    "solutions": (
+        lambda specification, cache: spaces.solutions_data(
+            specification.export,
+            specification.constraint,
+            cache=cache,
+            **specification.options
+        ),
+        spaces.draw_solutions,
+    ),
+    "latentContours": (
+        lambda specification, cache: spaces.latent_contours_data(
+            specification.export,
+            specification.constraint,
+            cache=cache,
+            **_options(specification)
+        ),
+        spaces.draw_latent_contours,
+    ),
+    "latentContoursInLatentSpace": (
+        lambda specification, cache: spaces.latent_contours_in_latent_space_data(
+            specification.export,
+            specification.constraint,
+            cache=cache,
+            **_options(specification)
+        ),
+        spaces.draw_latent_contours_in_latent_space,
+    ),
+    "satisfactionVsDensity": (
+        lambda specification, cache: specification.options,
+        lambda data: common.plot_satisfaction_vs_density(
+            show=False, latex=rcParams["text.usetex"], **data
+        ),
+    ),
+    "braninFunction": (
+        lambda specification, cache: specification.options,
+        lambda data: poster.plot_branin_function(
+            show=False, latex=rcParams["text.usetex"], **data
+        ),
+    ),
+}
@@ -6,6 +6,7 @@ import matplotlib.pyplot as plt
 import matplotlib.patheffects as pe
 import matplotlib.patches as mpatches
 import matplotlib.lines as mlines
+import matplotlib.colors as mcolors
 
 
 eps = 1e-4
@@ -45,41 +46,83 @@ def plot_solutions(
     when the satisfaction probability is predicted to be above some cutoff.
     """
     set_latex_font()
-    mesh = Mesh.unit
+    draw_solutions(
+        solutions_data(
+            export,
+            constraint,
+            n_samples,
+            dimensions=dimensions,
+            environment=environment,
+            satisfaction_cutoffs=satisfaction_cutoffs,
+        )
+    )
+    plt.show()
 
-    solutions = [
-        s.solution
-        for s in export.sample_for_constraint(np.array(constraint), n_samples)
-    ]
 
+def solutions_data(
+    export,
+    constraint,
+    n_samples,
+    dimensions=(0, 1),
+    environment=None,
+    satisfaction_cutoffs=None,
+    mesh=Mesh.unit,
+    cache=None,
+):
+    """
+    ExportedParametricGenerator -> [Float] -> Int -> (Int, Int)?
+        -> VectorEnvironment? -> (Float, Float)? -> Mesh? -> Dict? -> Dict
+    Evaluate everything needed to plot solutions sampled for a constraint,
+    as in `plot_solutions`, so that the figure can then be drawn by
+    `draw_solutions` without access to the model or the environment.
+    Evaluations over the mesh are stored in the cache, if one is given.
+    """
     x, y = dimensions
-    xs = [s[x] for s in solutions]
-    ys = [s[y] for s in solutions]
-
-    if environment is not None:
-        draw_truth_regions(
-            lambda p: environment.satisfaction(
-                (np.array([p[0], p[1]]), np.array(constraint))
-            ),
-            "red",
-            0.2,
-            mesh,
-        )
+    solutions = np.array(
+        [
+            s.solution
+            for s in export.sample_for_constraint(np.array(constraint), n_samples)
+        ]
+    )
+    return {
+        "mesh": mesh,
+        "dimensions": dimensions,
+        "solutions": solutions[:, [x, y]],
+        "truth": (
+            None
+            if environment is None
+            else environment_truth(environment, constraint, mesh, cache=cache)
+        ),
+        "probabilities": (
+            None
+            if satisfaction_cutoffs is None
+            else satisfaction_probabilities_on_mesh(
+                export, constraint, mesh, cache=cache
+            )
+        ),
+        "satisfactionCutoffs": satisfaction_cutoffs,
+    }
 
-    if satisfaction_cutoffs is not None:
-        discriminator = export.satisfaction_probability(np.array(constraint))
-        smin, smax = satisfaction_cutoffs
-        draw_truth_regions(
-            lambda p: smin <= discriminator(np.array([p[0], p[1]])) < smax,
-            "cyan",
-            0.2,
-            mesh,
-        )
-        draw_truth_regions(
-            lambda p: smax <= discriminator(np.array([p[0], p[1]])), "blue", 0.2, mesh
-        )
 
-    plt.plot(xs, ys, ".")
+def draw_solutions(data):
+    """
+    Dict -> ()
+    Draw sampled solutions, and the regions in which they satisfy the
+    constraint, on the current plot from data produced by `solutions_data`.
+    """
+    mesh = data["mesh"]
+    x, y = data["dimensions"]
+
+    if data["truth"] is not None:
+        draw_raster(data["truth"], "red", 0.2, mesh)
+
+    if data["satisfactionCutoffs"] is not None:
+        probabilities = data["probabilities"]
+        smin, smax = data["satisfactionCutoffs"]
+        draw_raster((smin <= probabilities) & (probabilities < smax), "cyan", 0.2, mesh)
+        draw_raster(smax <= probabilities, "blue", 0.2, mesh)
+
+    plt.plot(data["solutions"][:, 0], data["solutions"][:, 1], ".")
 
     legend = []
     legend.append(
@@ -94,23 +137,23 @@ def plot_solutions(
         )
     )
 
-    if environment is not None:
+    if data["truth"] is not None:
         legend.append(
             mpatches.Patch(
                 color="red", label="$h(c, [s_1, s_2])=\\mathrm{satisfied}$", alpha=0.2
             )
         )
-    if satisfaction_cutoffs is not None:
+    if data["satisfactionCutoffs"] is not None:
         legend.append(
             mpatches.Patch(
                 color="cyan",
-                label="${}\le h'(c, [s_1, s_2])<{}$".format(smin, smax),
+                label="${}\\leq h'(c, [s_1, s_2])<{}$".format(smin, smax),
                 alpha=0.2,
             )
         )
         legend.append(
             mpatches.Patch(
-                color="blue", label="$h'(c, [s_1, s_2])\ge{}$".format(smax), alpha=0.2
+                color="blue", label="$h'(c, [s_1, s_2])\\geq{}$".format(smax), alpha=0.2
             )
         )
 
@@ -119,16 +162,130 @@ def plot_solutions(
     mesh.bound_pyplot()
     plt.xlabel("$s_{}$".format(x + 1))
     plt.ylabel("$s_{}$".format(y + 1))
-    plt.show()
 
 
-def draw_truth_regions(f, colour, alpha, mesh, show=False):
+def environment_truth(environment, constraint, mesh, cache=None):
+    """
+    VectorEnvironment -> [Float] -> Mesh -> Dict? -> np.array
+    Return whether the environment considers each point of a two-dimensional
+    solution space mesh to satisfy the constraint, arranged in the shape of the
+    mesh.  The result is stored in the cache, if one is given.
+    """
+    return cached(
+        cache,
+        ("environmentTruth", id(environment), _constraint_key(constraint), mesh.key),
+        lambda: mesh.evaluate(
+            pointwise(
+                lambda p: environment.satisfaction(
+                    (np.array([p[0], p[1]]), np.array(constraint))
+                )
+            )
+        ),
+    )
+
+
+def satisfaction_probabilities_on_mesh(export, constraint, mesh, cache=None):
+    """
+    ExportedParametricGenerator -> [Float] -> Mesh -> Dict? -> np.array
+    Return the discriminator's satisfaction probability at each point of a
+    solution space mesh, arranged in the shape of the mesh.  The result is
+    stored in the cache, if one is given.
+    """
+    return cached(
+        cache,
+        (
+            "satisfactionProbabilities",
+            id(export),
+            _constraint_key(constraint),
+            mesh.key,
+        ),
+        lambda: mesh.evaluate(export.satisfaction_probabilities(np.array(constraint))),
+    )
+
+
+def latent_mesh_solutions(export, constraint, mesh, cache=None):
+    """
+    ExportedParametricGenerator -> [Float] -> Mesh -> Dict? -> np.array
+    Return the solution to which the generator maps each point of a latent
+    space mesh, arranged in the shape of the mesh.  The result is stored in the
+    cache, if one is given.
+    """
+    return cached(
+        cache,
+        ("latentMeshSolutions", id(export), _constraint_key(constraint), mesh.key),
+        lambda: mesh.evaluate(export.map_to_solution(constraint)),
+    )
+
+
+def cached(cache, key, evaluate):
     """
-    ((Float, Float) -> Bool) -> String -> Float -> Mesh -> Bool? -> ()
+    Dict? -> a -> (() -> b) -> b
+    Return the value stored in the cache under the given key, evaluating and
+    storing it first if it is not there.  If there is no cache, the value is
+    always evaluated.
+    """
+    if cache is None:
+        return evaluate()
+    if key not in cache:
+        cache[key] = evaluate()
+    return cache[key]
+
+
+def _constraint_key(constraint):
+    """
+    [Float] -> (Float...)
+    Return a hashable representation of a constraint.
+    """
+    return tuple(np.ravel(constraint).tolist())
+
+
+def draw_truth_regions(f, colour, alpha, mesh, show=False, batched=False):
+    """
+    Either ((Float, Float) -> Bool) (np.array -> np.array) -> String -> Float
+        -> Mesh -> Bool? -> Bool? -> ()
     Get the truth regions for a function on a given domain and then fill
-    them in on the current plot.  Optionally, show the plot afterwards.
+    them in on the current plot as a single raster layer.  If the function is
+    batched, it is called with arrays of mesh points and should return an array
+    of booleans; otherwise it is called once per point.  Optionally, show the
+    plot afterwards.
+    """
+    draw_raster(
+        mesh.evaluate(f if batched else pointwise(f)), colour, alpha, mesh, show=show
+    )
+
+
+def pointwise(f):
+    """
+    ((Float, Float) -> Bool) -> (np.array -> np.array)
+    Turn a predicate on single points into a batched predicate on an array
+    of points, one per row.
     """
-    draw_boxes(get_truth_regions(f, mesh), colour, alpha, mesh, show=show)
+    return lambda points: np.array([bool(f(point)) for point in points])
+
+
+def draw_raster(truth, colour, alpha, mesh, show=False):
+    """
+    np.array -> String -> Float -> Mesh -> Bool? -> ()
+    Shade the pixels of the mesh for which the given array, arranged in the
+    shape of the mesh, is True, drawing them all as a single image on the
+    current plot.  Optionally also draws the plot afterwards.
+    """
+    image = np.zeros([mesh.y_bins, mesh.x_bins, 4])
+    image[:, :, :3] = mcolors.to_rgb(colour)
+    image[:, :, 3] = alpha * np.transpose(truth)
+
+    dx = 0.5 * (mesh.x_max - mesh.x_min) / max(mesh.x_bins - 1, 1)
+    dy = 0.5 * (mesh.y_max - mesh.y_min) / max(mesh.y_bins - 1, 1)
+    plt.imshow(
+        image,
+        origin="lower",
+        extent=[mesh.x_min - dx, mesh.x_max + dx, mesh.y_min - dy, mesh.y_max + dy],
+        interpolation="nearest",
+        aspect="auto",
+    )
+
+    if show:
+        plt.show()
 
 
 def get_truth_regions(f, mesh):
@@ -175,91 +332,79 @@ def plot_latent_contours(
     solution space.
     """
     set_latex_font()
-
-    if environment is not None:
-        draw_truth_regions(
-            lambda p: environment.satisfaction(
-                (np.array([p[0], p[1]]), np.array(constraint))
-            ),
-            "grey",
-            0.2,
+    draw_latent_contours(
+        latent_contours_data(
+            export,
+            constraint,
             mesh,
+            thinning_factor=thinning_factor,
+            environment=environment,
+            legend=legend,
         )
+    )
+    plt.show()
 
-    x_contours = mesh.x_contours[::thinning_factor]
-    y_contours = mesh.y_contours[::thinning_factor]
 
-    mapper = export.map_to_solution(constraint)
-    x_contour_coords = [mapper(x_contour) for x_contour in x_contours]
-    y_contour_coords = [mapper(y_contour) for y_contour in y_contours]
+def latent_contours_data(
+    export,
+    constraint,
+    mesh,
+    thinning_factor=5,
+    environment=None,
+    legend=True,
+    cache=None,
+):
+    """
+    ExportedParametricGenerator -> [Float] -> Mesh -> Int?
+        -> VectorEnvironment? -> Bool? -> Dict? -> Dict
+    Evaluate everything needed to plot the images of latent contours in the
+    solution space, as in `plot_latent_contours`, so that the figure can then
+    be drawn by `draw_latent_contours`.  The whole mesh is mapped to the
+    solution space at once, and evaluations are stored in the cache, if one is
+    given.
+    """
+    solutions = latent_mesh_solutions(export, constraint, mesh, cache=cache)
+    return {
+        "mesh": mesh,
+        "xContours": mesh.contours(1, values=solutions)[::thinning_factor],
+        "yContours": mesh.contours(0, values=solutions)[::thinning_factor],
+        "truth": (
+            None
+            if environment is None
+            else environment_truth(environment, constraint, mesh, cache=cache)
+        ),
+        "legend": legend,
+    }
+
+
+def draw_latent_contours(data):
+    """
+    Dict -> ()
+    Draw the images of latent contours in the solution space on the current
+    plot from data produced by `latent_contours_data`.
+    """
+    mesh = data["mesh"]
 
-    for contour in x_contour_coords[1:]:
-        xs, ys = zip(*contour)
-        plt.plot(xs, ys, "blue", alpha=0.4)
+    if data["truth"] is not None:
+        draw_raster(data["truth"], "grey", 0.2, mesh)
 
-    for contour in y_contour_coords[1:]:
-        xs, ys = zip(*contour)
-        plt.plot(xs, ys, "red", alpha=0.4)
+    x_contour_coords = data["xContours"]
+    y_contour_coords = data["yContours"]
+    _draw_contours(x_contour_coords, y_contour_coords)
 
     left, right = x_contour_coords[0], x_contour_coords[-1]
-
-    def clip(a, b):
-        return lambda x: a if x < a else (b if x > b else x)
-
-    def plot_text(x, y, text):
-        text_border_x = 0.1
-        text_border_y = 0.05
-        plt.text(
-            clip(mesh.x_min + text_border_x, mesh.x_max - text_border_x)(x),
-            clip(mesh.y_min + text_border_y, mesh.y_max - text_border_y)(y),
-            text,
-            ha="center",
-            bbox={"facecolor": "white", "edgecolor": "none", "pad": 1, "alpha": 0.6},
-        )
-
+    plot_text = _contour_labeller(mesh)
     plot_text(left[0][0], left[0][1], "$l=(0,0)$")
     plot_text(left[-1][0], left[-1][1], "$l=(0,1)$")
     plot_text(right[0][0], right[0][1], "$l=(1,0)$")
     plot_text(right[-1][0], right[-1][1], "$l=(1,1)$")
 
-    if legend:
-        legend = []
-        legend.append(
-            mlines.Line2D(
-                [],
-                [],
-                color="blue",
-                marker="None",
-                alpha=0.4,
-                markersize=10,
-                label="$l_1=\\mathrm{const}$",
-            )
-        )
-        legend.append(
-            mlines.Line2D(
-                [],
-                [],
-                color="red",
-                marker="None",
-                alpha=0.4,
-                markersize=10,
-                label="$l_2=\\mathrm{const}$",
-            )
-        )
-        if environment is not None:
-            legend.append(
-                mpatches.Patch(
-                    color="grey",
-                    label="$h(c, [s_1, s_2])=\\mathrm{satisfied}$",
-                    alpha=0.2,
-                )
-            )
-        plt.legend(handles=legend)
+    if data["legend"]:
+        _draw_contour_legend(data["truth"] is not None)
 
     mesh.bound_pyplot()
     plt.xlabel("$s_1$")
     plt.ylabel("$s_2$")
-    plt.show()
 
 
 def plot_latent_contours_in_latent_space(
@@ -278,24 +423,97 @@ def plot_latent_contours_in_latent_space(
     latent space.
     """
     set_latex_font()
+    draw_latent_contours_in_latent_space(
+        latent_contours_in_latent_space_data(
+            export,
+            constraint,
+            mesh,
+            thinning_factor=thinning_factor,
+            environment=environment,
+            legend=legend,
+        )
+    )
+    plt.show()
 
-    mapper = export.map_to_solution(constraint)
 
-    def latent_point_satisfies_constraint(p):
-        _p = mapper(p)
-        return environment.satisfaction(
-            (np.array([_p[0], _p[1]]), np.array(constraint))
+def latent_contours_in_latent_space_data(
+    export,
+    constraint,
+    mesh,
+    thinning_factor=5,
+    environment=None,
+    legend=True,
+    cache=None,
+):
+    """
+    ExportedParametricGenerator -> [Float] -> Mesh -> Int?
+        -> VectorEnvironment? -> Bool? -> Dict? -> Dict
+    Evaluate everything needed to plot latent contours in the latent space, as
+    in `plot_latent_contours_in_latent_space`, so that the figure can then be
+    drawn by `draw_latent_contours_in_latent_space`.  Evaluations are stored in
+    the cache, if one is given.
+    """
+
+    def latent_truth():
+        solutions = latent_mesh_solutions(export, constraint, mesh, cache=cache)
+        return mesh.reshape(
+            pointwise(
+                lambda s: environment.satisfaction(
+                    (np.array([s[0], s[1]]), np.array(constraint))
+                )
+            )(np.reshape(solutions, [mesh.point_count, -1]))
         )
 
-    if environment is not None:
-        draw_truth_regions(latent_point_satisfies_constraint, "grey", 0.2, mesh)
+    return {
+        "mesh": mesh,
+        "xContours": mesh.x_contours[::thinning_factor],
+        "yContours": mesh.y_contours[::thinning_factor],
+        "truth": (
+            None
+            if environment is None
+            else cached(
+                cache,
+                (
+                    "latentTruth",
+                    id(export),
+                    id(environment),
+                    _constraint_key(constraint),
+                    mesh.key,
+                ),
+                latent_truth,
+            )
+        ),
+        "legend": legend,
+    }
+
+
+def draw_latent_contours_in_latent_space(data):
+    """
+    Dict -> ()
+    Draw latent contours in the latent space on the current plot from data
+    produced by `latent_contours_in_latent_space_data`.
+    """
+    mesh = data["mesh"]
+
+    if data["truth"] is not None:
+        draw_raster(data["truth"], "grey", 0.2, mesh)
 
-    x_contours = mesh.x_contours[::thinning_factor]
-    y_contours = mesh.y_contours[::thinning_factor]
+    _draw_contours(data["xContours"], data["yContours"])
 
-    x_contour_coords = [[[x, y] for x, y in contour] for contour in x_contours]
-    y_contour_coords = [[[x, y] for x, y in contour] for contour in y_contours]
+    if data["legend"]:
+        _draw_contour_legend(data["truth"] is not None)
 
+    mesh.bound_pyplot()
+    plt.xlabel("$l_1$")
+    plt.ylabel("$l_2$")
+
+
+def _draw_contours(x_contour_coords, y_contour_coords):
+    """
+    np.array -> np.array -> ()
+    Draw lines of constant l_1 in blue and lines of constant l_2 in red,
+    omitting the first of each.
+    """
     for contour in x_contour_coords[1:]:
         xs, ys = zip(*contour)
         plt.plot(xs, ys, "blue", alpha=0.4)
@@ -304,7 +522,13 @@ def plot_latent_contours_in_latent_space(
         xs, ys = zip(*contour)
         plt.plot(xs, ys, "red", alpha=0.4)
 
-    left, right = x_contour_coords[0], x_contour_coords[-1]
+
+def _contour_labeller(mesh):
+    """
+    Mesh -> (Float -> Float -> String -> ())
+    Return a function which labels a point on the current plot, keeping the
+    label clear of the edges of the mesh.
+    """
 
     def clip(a, b):
         return lambda x: a if x < a else (b if x > b else x)
@@ -320,44 +544,47 @@ def plot_latent_contours_in_latent_space(
             bbox={"facecolor": "white", "edgecolor": "none", "pad": 1, "alpha": 0.6},
         )
 
-    if legend:
-        legend = []
-        legend.append(
-            mlines.Line2D(
-                [],
-                [],
-                color="blue",
-                marker="None",
-                alpha=0.4,
-                markersize=10,
-                label="$l_1=\\mathrm{const}$",
-            )
+    return plot_text
+
+
+def _draw_contour_legend(truth):
+    """
+    Bool -> ()
+    Add a legend for latent contours to the current plot, including the
+    satisfied region if it has been drawn.
+    """
+    legend = []
+    legend.append(
+        mlines.Line2D(
+            [],
+            [],
+            color="blue",
+            marker="None",
+            alpha=0.4,
+            markersize=10,
+            label="$l_1=\\mathrm{const}$",
         )
+    )
+    legend.append(
+        mlines.Line2D(
+            [],
+            [],
+            color="red",
+            marker="None",
+            alpha=0.4,
+            markersize=10,
+            label="$l_2=\\mathrm{const}$",
+        )
+    )
+    if truth:
         legend.append(
-            mlines.Line2D(
-                [],
-                [],
-                color="red",
-                marker="None",
-                alpha=0.4,
-                markersize=10,
-                label="$l_2=\\mathrm{const}$",
+            mpatches.Patch(
+                color="grey",
+                label="$h(c, [s_1, s_2])=\\mathrm{satisfied}$",
+                alpha=0.2,
             )
         )
-        if environment is not None:
-            legend.append(
-                mpatches.Patch(
-                    color="grey",
-                    label="$h(c, [s_1, s_2])=\\mathrm{satisfied}$",
-                    alpha=0.2,
-                )
-            )
-        plt.legend(handles=legend)
-
-    mesh.bound_pyplot()
-    plt.xlabel("$l_1$")
-    plt.ylabel("$l_2$")
-    plt.show()
+    plt.legend(handles=legend)
 
 
 def set_latex_font():